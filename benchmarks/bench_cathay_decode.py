@@ -0,0 +1,82 @@
+"""
+Micro-benchmark: deep_json_load (previous decoder) vs load_embedded_json on Cathay
+availability responses, plus a check that CathayExtractor.extract_offers output is unchanged.
+
+    python benchmarks/bench_cathay_decode.py responses/*.json
+    python benchmarks/bench_cathay_decode.py            # synthetic response
+
+Recorded files are raw availability responses (resp.json() of CathayExtractor.search_flights_for_date).
+"""
+from pathlib import Path
+import asyncio
+import json
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cathay_extractor import CathayExtractor, EMBEDDED_JSON_FIELDS  # noqa: E402
+from utils.uploader import LocalBucket  # noqa: E402
+from utils.utils import deep_json_load, load_embedded_json  # noqa: E402
+
+
+def synthetic_response(flights=80):
+    def segment(n, origin, destination):
+        return {
+            "flightIdentifier": {"marketingAirline": "CX", "flightNumber": str(100 + n), "originDate": 1773273600000},
+            "originLocation": origin,
+            "destinationLocation": destination,
+            "equipment": "359",
+            "cabins": {c: {"status": str(n % 9) if c == "B" else "L"} for c in ("F", "B", "N", "R")},
+            "numberOfStops": 0,
+        }
+
+    page_bom = {
+        "modelObject": {
+            "isContainingErrors": False,
+            "availabilities": {"upsell": {"bounds": [{"flights": [
+                {
+                    "bookable": True,
+                    "flightIdString": f"MEL:HKG:NRT_CX{100 + n}_CX{500 + n}_20260312_BUSFIR",
+                    "segments": [segment(n, "MEL", "HKG"), segment(n + 1, "HKG", "NRT")],
+                    "duration": 64800000,
+                }
+                for n in range(flights)
+            ]}]}},
+        },
+        "dictionaries": {"locations": {code: {"cityName": code, "countryCode": "XX"} for code in ("MEL", "HKG", "NRT")}},
+    }
+    return {"pageBom": json.dumps(page_bom), "pageCode": "Upsell", "requestParams": json.dumps({"TAB_ID": "x"})}
+
+
+def load_payloads(paths):
+    if not paths:
+        return [("synthetic", synthetic_response())]
+    return [(p, json.loads(Path(p).read_text())) for p in paths]
+
+
+def main(paths):
+    extractor = CathayExtractor(bucket=LocalBucket(tempfile.mkdtemp()))
+    extractor.miles_cache.path = None
+
+    async def no_network(mile_keys):
+        return {key: 60000 for key in mile_keys}
+
+    extractor.get_milesInfo = no_network
+
+    for name, payload in load_payloads(paths):
+        old = asyncio.run(extractor.extract_offers(deep_json_load(payload), "MEL", "NRT", "2026-03-12"))
+        new = asyncio.run(extractor.extract_offers(payload, "MEL", "NRT", "2026-03-12"))
+        assert old == new, "load_embedded_json changed extract_offers output"
+
+        deep_s = min(timeit.repeat(lambda: deep_json_load(payload), number=20, repeat=5)) / 20
+        targeted_s = min(timeit.repeat(lambda: load_embedded_json(payload, EMBEDDED_JSON_FIELDS), number=20, repeat=5)) / 20
+        print(f"{name}: {len(new or [])} results")
+        print(f"  deep_json_load:     {deep_s * 1000:8.2f} ms/response")
+        print(f"  load_embedded_json: {targeted_s * 1000:8.2f} ms/response")
+        print(f"  speedup {deep_s / targeted_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
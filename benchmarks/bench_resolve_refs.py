@@ -0,0 +1,126 @@
+"""
+Micro-benchmark: eager deep-copy resolve_refs (previous implementation) vs the lazy view,
+each followed by VirginExtractor.extract_offers, on recorded bookingAirSearch responses.
+
+    python benchmarks/bench_resolve_refs.py responses/*.json
+    python benchmarks/bench_resolve_refs.py            # synthetic payload
+
+Recorded files are raw GraphQL responses as returned by VirginExtractor.search_flights_for_date.
+"""
+from pathlib import Path
+import json
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.uploader import LocalBucket  # noqa: E402
+from virgin_extractor import VirginExtractor  # noqa: E402
+
+
+def eager_resolve_refs(obj):
+    id_map = {}
+
+    def collect(o):
+        if isinstance(o, dict):
+            if "@id" in o:
+                id_map[o["@id"]] = o
+            for v in o.values():
+                collect(v)
+        elif isinstance(o, list):
+            for v in o:
+                collect(v)
+
+    def deref(o):
+        if isinstance(o, dict):
+            if "@ref" in o:
+                return deref(id_map[o["@ref"]])
+            return {k: deref(v) for k, v in o.items()}
+        elif isinstance(o, list):
+            return [deref(v) for v in o]
+        else:
+            return o
+
+    collect(obj)
+    return deref(obj)
+
+
+def synthetic_offers(days=7, offers_per_day=40, segments=60):
+    """Offers sharing segment objects through @ref, like the real unbundledOffers."""
+    shared = [
+        {
+            "@id": f"seg{i}",
+            "origin": "MEL" if i % 2 == 0 else "HKG",
+            "destination": "HKG" if i % 2 == 0 else "NRT",
+            "flight": {"airlineCode": "VA", "flightNumber": str(100 + i), "equipment": {"code": "789", "details": ["x"] * 20}},
+            "cabinClass": "Business",
+            "bookingClass": "I",
+            "notes": [{"text": "lorem ipsum " * 10} for _ in range(5)],
+        }
+        for i in range(segments)
+    ]
+    offers = []
+    emitted = set()
+
+    def segment(i):
+        # First occurrence carries the object, every later one is an @ref to it
+        if i in emitted:
+            return {"@ref": f"seg{i}"}
+        emitted.add(i)
+        return shared[i]
+
+    for day in range(days):
+        date = f"2026-03-{10 + day:02d}"
+        day_offers = []
+        for n in range(offers_per_day):
+            a = (2 * n) % segments
+            day_offers.append({
+                "cabinClass": "Business",
+                "offerInformation": {"negotiated": n % 3 != 0},
+                "departureDates": [date],
+                "fare": {"alternatives": [[{"amount": 60000 + n * 1000, "currency": "FFCURRENCY"}]]},
+                "itineraryPart": [{"segments": [segment(a), segment(a + 1)]}],
+            })
+        offers.append(day_offers)
+    return {"data": {"bookingAirSearch": {"originalResponse": {"unbundledOffers": offers}}}}
+
+
+def load_payloads(paths):
+    if not paths:
+        return [("synthetic", synthetic_offers())]
+    return [(p, json.loads(Path(p).read_text())) for p in paths]
+
+
+def measure(fn, number):
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main(paths):
+    extractor = VirginExtractor(bucket=LocalBucket(tempfile.mkdtemp()))
+    for name, payload in load_payloads(paths):
+        offers = payload.get("data", {}).get("bookingAirSearch", {}).get("originalResponse", {}).get("unbundledOffers", [])
+
+        def eager():
+            return extractor.extract_offers(eager_resolve_refs(offers), "MEL", "NRT", "2026-03-10")
+
+        def lazy():
+            return extractor.extract_offers(extractor.resolve_refs(offers), "MEL", "NRT", "2026-03-10")
+
+        assert eager() == lazy(), "lazy resolver changed extract_offers output"
+        eager_s, eager_mem = measure(eager, 20)
+        lazy_s, lazy_mem = measure(lazy, 20)
+        print(f"{name}: {len(lazy())} results")
+        print(f"  eager: {eager_s * 1000:8.2f} ms/search  peak {eager_mem / 1024:8.0f} KiB")
+        print(f"  lazy:  {lazy_s * 1000:8.2f} ms/search  peak {lazy_mem / 1024:8.0f} KiB")
+        print(f"  speedup {eager_s / lazy_s:.1f}x, memory {eager_mem / max(lazy_mem, 1):.1f}x less")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,16 +1,25 @@
 from extractor import Extractor
 from rich import print
-import json
-from camoufox.async_api import AsyncCamoufox
 from urllib.parse import urlencode
-from utils.utils import date_add, deep_json_load
+from utils.utils import date_add, load_embedded_json
+from utils.codec import dumps, loads
+from utils.records import FlightResult
+from utils.cache import TTLCache
+import asyncio
 import os
 import re
+import time
+
+
+# Response fields that hold JSON encoded as a string
+EMBEDDED_JSON_FIELDS = ("pageBom", "modelObject", "requestParams")
 
 
 class CathayExtractor(Extractor):
-    def __init__(self, proxy: str = None):
-        super().__init__(proxy)
+    shared_attributes = Extractor.shared_attributes + ("miles_cache",)
+
+    def __init__(self, proxy: str = None, tab_pool_size: int = 4, **kwargs):
+        super().__init__(proxy, **kwargs)
         self.phone = os.getenv("PHONE")
         self.password = os.getenv("PASSWORD")
         self.program = "Cathay"
@@ -18,11 +27,25 @@ class CathayExtractor(Extractor):
         self.base_url = "https://book.cathaypacific.com/CathayPacificAwardV3/dyn/air/booking/availability?TAB_ID="
         self.payload = {}
         self.ENC = ""
+        # TAB_IDs minted from ENC; each concurrent search checks one out for its request.
+        # Idle tabs carry the session generation they were minted under and die with it.
+        self.tab_pool_size = tab_pool_size
+        self.idle_tabs = []
+        self.tab_count = 0
+        self.tab_condition = asyncio.Condition()
         self.login_url = "https://www.cathaypacific.com/cx/en_CN/sign-in.html?loginreferrer=https%3A%2F%2Fwww.cathaypacific.com%2Fcx%2Fen_CN%2Fbook-a-trip%2Fredeem-flights%2Fredeem-flight-awards.html"
-    
+        # flightId -> miles, shared across days and persisted across runs
+        self.miles_cache = TTLCache(
+            ttl=int(os.getenv("CATHAY_MILES_TTL", 24 * 3600)),
+            path=os.getenv("CATHAY_MILES_CACHE", "db/cathay_miles.json"),
+        )
+
+    async def finish_crawl(self):
+        await super().finish_crawl()
+        self.miles_cache.save()
+
     async def headers_from_browser(self, url, headless = True) -> dict:
-        async with AsyncCamoufox(headless=headless, main_world_eval=True) as browser:
-            page = await browser.new_page()
+        async with self.browser_page(headless, main_world_eval=True) as page:
 
             headers = {
                 "accept": "application/json, text/plain, */*",
@@ -53,7 +76,7 @@ class CathayExtractor(Extractor):
             requestParams = await page.evaluate("mw:window.requestParams")
             
             if isinstance(requestParams, str):
-                requestParams = json.loads(requestParams)
+                requestParams = loads(requestParams)
             self.tab_id = requestParams.get("TAB_ID", "")
             self.ENC = requestParams.get("ENC", "")
             requestParams.pop("SERVICE_ID", None)
@@ -78,35 +101,81 @@ class CathayExtractor(Extractor):
     async def search_flights_for_date(self, origin: str, destination: str, date: str) -> list:
         max_retries = 3
         retries = 0
+        generation = await self.wait_for_session()
         try:
             while retries < max_retries:
                 async with self.limiter:
-                    self.payload.update({
+                    generation = await self.wait_for_session()
+                    tab_id = await self.checkout_tab(generation)
+                    if tab_id is None:
+                        raise RuntimeError("failed to get a new TAB_ID")
+                    # Per-request copy: concurrent searches never see each other's route and date
+                    payload = {
+                        **self.payload,
                         "B_DATE_1": date.replace("-", "") + "0000",
                         "B_LOCATION_1": origin,
                         "E_LOCATION_1": destination,
-                    })
-                    encoded_data = "&".join(f"{k}={v}" for k, v in self.payload.items())
-                    resp = await self.session.post(
-                        url=self.base_url + self.tab_id,
-                        data=encoded_data,
-                    )
-
-                    if resp.status_code < 300 and resp.status_code != 404:
-                        return await self.extract_offers(resp.json(), origin, destination, date)
-
-                    tab_result = await self.new_tab_id()
-                    if tab_result is None:
-                        print("Failed to get new TAB_ID, aborting retry.")
-                        break
+                    }
+                    encoded_data = "&".join(f"{k}={v}" for k, v in payload.items())
+                    healthy = False
+                    try:
+                        resp = await self.post(
+                            url=self.base_url + tab_id,
+                            data=encoded_data,
+                        )
+                        healthy = resp.status_code < 300 and resp.status_code != 404
+                    finally:
+                        # A failed tab is dropped and its slot re-minted on the next checkout
+                        await self.checkin_tab(tab_id, generation, healthy)
+
+                    if healthy:
+                        with self.metrics.timer("parse_seconds", stage="decode"):
+                            data = loads(resp.content)
+                        results = await self.extract_offers(data, origin, destination, date)
+                        if results is not None:
+                            self.mark_answered(origin, destination, [date])
+                        return results
                     retries += 1
+            raise RuntimeError(f"HTTP {resp.status_code} on every one of {max_retries} attempts")
         except Exception as e:
             print(f"Error CX fetching for {origin} → {destination} on {date}:{type(e)}: {e}")
-            await self.headers_from_browser(self.login_url)
-            return []
-            
-            
-        
+            await self.refresh_session(generation)
+            raise
+
+    async def checkout_tab(self, generation: int) -> str | None:
+        """
+        An idle TAB_ID of the current session, or a newly minted one while the pool has room;
+        waits for a tab to come back when all tab_pool_size tabs are in use.
+        Returns None when minting fails (new_tab_id has then asked for a re-login).
+        """
+        async with self.tab_condition:
+            while True:
+                while self.idle_tabs:
+                    tab_id, tab_generation = self.idle_tabs.pop()
+                    if tab_generation == generation:
+                        return tab_id
+                    # Minted under a session that has since been refreshed
+                    self.tab_count -= 1
+                if self.tab_count < self.tab_pool_size:
+                    self.tab_count += 1
+                    break
+                await self.tab_condition.wait()
+        tab_id = None
+        try:
+            tab_id = await self.new_tab_id(generation)
+        finally:
+            if tab_id is None:
+                await self.checkin_tab(None, generation, False)
+        return tab_id
+
+    async def checkin_tab(self, tab_id: str | None, generation: int, healthy: bool):
+        async with self.tab_condition:
+            if healthy and tab_id:
+                self.idle_tabs.append((tab_id, generation))
+            else:
+                self.tab_count -= 1
+            self.tab_condition.notify()
+
     def new_query_payload(
         self,
         route={"from": "ITM", "to": "HND", "date": None},
@@ -146,15 +215,22 @@ class CathayExtractor(Extractor):
         full_url = f"{base_url}?{urlencode(params)}"
         return full_url
     
-    async def log_request(self, request):        
-        pass
-    async def log_response(self, response):
-        pass
-    
     async def get_milesInfo(self, mile_keys):
+        """Resolve miles for a list of flightIds: cached ids skip the network, the rest go out in one batched call."""
+        miles = {}
+        missing = []
+        for key in dict.fromkeys(mile_keys):
+            cached = self.miles_cache.get(key)
+            if cached is None:
+                missing.append(key)
+            else:
+                miles[key] = cached
+        if not missing:
+            return miles
+
         url = "https://api.cathaypacific.com/redibe/milesInfo/v2.0"
         data = {
-            "milesInfoList": [mile_keys]
+            "milesInfoList": missing
         }
         headers = {
             'accept': 'application/json, text/plain, */*',
@@ -171,15 +247,23 @@ class CathayExtractor(Extractor):
             'sec-fetch-site': 'same-site',
             'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36',
         }
-        resp = await self.session.post(url,headers=headers, json=data)
+        resp = await self.post(url,headers=headers, data=dumps(data))
         # text = await resp.text()
-        return resp.json()['milesInfo']
+        fetched = loads(resp.content)['milesInfo']
+        for key, value in fetched.items():
+            self.miles_cache.set(key, value)
+        miles.update(fetched)
+        return miles
         
 
     async def extract_offers(self, data, origin, destination, date):
-        res_data = deep_json_load(data)
-        pageBom = res_data.get("pageBom", "{}")
+        with self.metrics.timer("parse_seconds", stage="embedded_json"):
+            res_data = load_embedded_json(data, EMBEDDED_JSON_FIELDS)
+        # Timed up to the miles lookup, whose network time lands in the request metrics
+        start = time.perf_counter()
+        pageBom = res_data.get("pageBom", {})
         results = []
+        pending = []
         if pageBom.get("modelObject", {}).get("isContainingErrors"):
             print("Error:", pageBom["modelObject"].get("messages", [{}])[0].get("text"))
             return
@@ -205,17 +289,15 @@ class CathayExtractor(Extractor):
                         flightData = f"{leg1_airline}{leg1_flight_no}"
                         cabin_class = "Bus" if str(j1).isdigit() else "First"
                         flightId = flight["flightIdString"][:-3] + ("BUS" if str(j1).isdigit() else "FIR")
-                        mileInfo = await self.get_milesInfo(flightId)
-                        results.append({
-                            "origin": origin,
-                            "destination": destination,
-                            "date": date,
-                            "cabin": cabin_class,
-                            "points": mileInfo[flightId],
-                            "route": flightData,
-                            "stops": len(flight["segments"]) - 1,
-                            "program": self.program
-                        })
+                        pending.append((flightId, dict(
+                            origin=origin,
+                            destination=destination,
+                            date=date,
+                            cabin=cabin_class,
+                            route=flightData,
+                            stops=len(flight["segments"]) - 1,
+                            program=self.program,
+                        )))
                     else:
                         seg2 = flight["segments"][1]
                         cabins2 = seg2.get("cabins", {})
@@ -233,21 +315,47 @@ class CathayExtractor(Extractor):
                         flightData = f"{leg1_airline}{leg1_flight_no}_{stopcity}_{leg2_airline}{leg2_flight_no}"
                         cabin_class = "Bus" if str(j1).isdigit() else "First"
                         flightId = flight["flightIdString"][:-3] + ("BUS" if str(j1).isdigit() else "FIR")
-                        mileInfo = await self.get_milesInfo(flightId)
-                        results.append({
-                            "origin": origin,
-                            "destination": destination,
-                            "date": date,
-                            "cabin": cabin_class,
-                            "points": mileInfo[flightId],
-                            "route": flightData,
-                            "stops": len(flight["segments"]) - 1,
-                            "program": self.program
-                        })
+                        pending.append((flightId, dict(
+                            origin=origin,
+                            destination=destination,
+                            date=date,
+                            cabin=cabin_class,
+                            route=flightData,
+                            stops=len(flight["segments"]) - 1,
+                            program=self.program,
+                        )))
+
+        self.metrics.observe("parse_seconds", time.perf_counter() - start, stage="extract_offers")
+        if pending:
+            mileInfo = await self.get_milesInfo([flightId for flightId, _ in pending])
+            for flightId, fields in pending:
+                results.append(FlightResult(points=mileInfo.get(flightId), **fields))
 
         return results
     
-    async def new_tab_id(self) -> str | None:
+    def export_session(self) -> dict:
+        state = super().export_session()
+        state.update({"tab_id": self.tab_id, "ENC": self.ENC, "payload": self.payload})
+        return state
+
+    def import_session(self, state: dict):
+        super().import_session(state)
+        self.tab_id = state.get("tab_id", "")
+        self.ENC = state.get("ENC", "")
+        self.payload = state.get("payload", {})
+
+    async def validate_session(self) -> bool:
+        # Minting a TAB_ID from the stored ENC is the cheapest call that needs a live login
+        return await self.request_tab_id() is not None
+
+    async def new_tab_id(self, generation: int = None) -> str | None:
+        tab_id = await self.request_tab_id()
+        if tab_id is None:
+            await self.refresh_session(generation)
+        return tab_id
+
+    async def request_tab_id(self) -> str | None:
+        """Mint a TAB_ID over HTTP only; returns None instead of re-logging in on failure."""
         if not self.ENC:
             print("Error: No ENC found in request_params.")
             return None
@@ -270,24 +378,21 @@ class CathayExtractor(Extractor):
             }
 
         try:
-            response = await self.session.post(url, data=parameters, headers=headers)
+            response = await self.post(url, data=parameters, headers=headers)
         except Exception as e:
             print(f"Request failed: {e}")
-            await self.headers_from_browser(self.login_url)
             return None
 
         if response.status_code != 200:
             print(f"Failed to receive Tab ID (HTTP {response.status_code}).")
-            await self.headers_from_browser(self.login_url)
             return None
 
         try:
-            data = response.json()
-            deep_data = deep_json_load(data)
+            data = loads(response.content)
+            deep_data = load_embedded_json(data, EMBEDDED_JSON_FIELDS)
         
         except Exception as e:
             print("fail parsing response:", e)
-            await self.headers_from_browser(self.login_url)
             return None
 
 
@@ -295,14 +400,11 @@ class CathayExtractor(Extractor):
         
         if not match:
             print("Could not parse requestParams. Re-login")
-            await self.headers_from_browser(self.login_url)
-
             return None
 
         tab_id = match.get("TAB_ID")
         if not tab_id:
             print("No TAB_ID found in requestParams.")
-            await self.headers_from_browser(self.login_url)
             return None
 
         self.tab_id = tab_id
@@ -1,38 +1,137 @@
 from camoufox.async_api import AsyncCamoufox
 from rich import print
 from utils.utils import date_range
-from aiolimiter import AsyncLimiter
+from utils.uploader import ResultUploader
+from utils.browser_manager import playwright_proxy
+from utils.codec import dumps
+from utils.rate_limiter import AdaptiveLimiter
+from utils.session_pool import SessionPool
+from utils.metrics import Metrics
+from utils.records import Batch
 from typing import List
 from curl_cffi import AsyncSession, CurlHttpVersion
 from google.cloud import storage
-import json
-from datetime import datetime
+import asyncio
+import time
+from contextlib import aclosing, asynccontextmanager
+from urllib.parse import urlencode
 
 
 class Extractor:
-    def __init__(self, proxy: str = None):
-        self.session = AsyncSession(impersonate="firefox135", default_headers=True, http_version=CurlHttpVersion.V1_1)
+    # Crawl bookkeeping every identity of a program's session pool shares with the primary
+    shared_attributes = ("covered_keys", "answers", "metrics")
+
+    def __init__(self, proxy: str = None, workers: int = 1, bucket=None, session_store=None, browser_manager=None, rate_store=None, availability_index=None, save_blobs: bool = True, change_index=None, checkpoint=None, scheduler=None, sink=None):
+        self.proxy = proxy
+        self.session = self.new_session(proxy)
+        # Extra identities of this program (SessionPool); member_index tells them apart in the session store
+        self.pool = None
+        self.member_index = 0
+        self.metrics = Metrics()
+        self.limiter = AdaptiveLimiter(rate=40)
+        self.limiter.observer = lambda wait: self.metrics.observe("limiter_wait_seconds", wait)
+        self.rate_store = rate_store
+        # Programs whose responses cover several days record every (origin, destination, date)
+        # a response already answered, so the crawl does not search it again
+        self.covered_keys = set()
+        self.availability_index = availability_index
+        self.change_index = change_index
+        # Durable progress log, so a crashed crawl can resume where it stopped
+        self.checkpoint = checkpoint
+        # Orders (and budgets) the keys of a crawl by priority instead of walking dates in order
+        self.scheduler = scheduler
+        # (origin, destination, searched date) -> dates a successful response answered
+        self.answers = {}
+        self.workers = workers
+        self.login_url = ""
+        self.program = ""
+        self.bucket_name = "reward-flight-results"
+        if bucket is None:
+            self.storage_client = storage.Client()
+            bucket = self.storage_client.bucket(self.bucket_name)
+        self.bucket = bucket
+        self.uploader = ResultUploader(self.bucket, metrics=self.metrics)
+        # One object per (date, origin, destination); off when results go to run shards instead
+        self.save_blobs = save_blobs
+        # Run shard writer (ShardSink) every yielded batch is stored in
+        self.sink = sink
+        self.session_store = session_store
+        self.browser_manager = browser_manager
+        # Single-flight refresh state: one refresh per program at a time, requests park on session_ready
+        self.refresh_lock = asyncio.Lock()
+        self.session_ready = asyncio.Event()
+        self.session_ready.set()
+        self.session_generation = 0
+        self.last_refresh = 0.0
+        self.refresh_debounce = 30
+        # Keepalive: idle sessions are probed over HTTP at half their observed lifetime
+        self.session_started = time.monotonic()
+        self.session_lifetime = None
+        self.last_request = time.monotonic()
+        self.keepalive_default = 300
+        self.keepalive_min = 30
+        self.keepalive_max = 900
+
+    def new_session(self, proxy: str = None, http_version=CurlHttpVersion.V1_1) -> AsyncSession:
+        session = AsyncSession(impersonate="firefox135", default_headers=True, http_version=http_version)
         if proxy:
-            self.session.proxies.update({
+            session.proxies.update({
                 "http": proxy,
                 "https": proxy,
             })
-        self.limiter = AsyncLimiter(max_rate=40)
-        self.login_url = ""
-        self.program = ""
-        self.storage_client = storage.Client()
-        self.bucket_name = "reward-flight-results"
-        self.bucket = self.storage_client.bucket(self.bucket_name)
+        return session
+
+    @property
+    def session_key(self) -> str:
+        return self.program if not self.member_index else f"{self.program}#{self.member_index}"
+
+    @property
+    def identities(self) -> list:
+        return self.pool.identities if self.pool else [self]
+
+    def add_members(self, members):
+        """
+        Spread this program's searches over more identities, e.g. one instance per proxy.
+        Members keep their own session, limiter and refresh state and share the crawl bookkeeping.
+        """
+        members = list(members)
+        if not members:
+            return
+        for i, member in enumerate(members, 1):
+            member.member_index = i
+            for name in self.shared_attributes:
+                setattr(member, name, getattr(self, name))
+        self.pool = SessionPool([self, *members])
+
+    @asynccontextmanager
+    async def identity(self):
+        """The identity to run the next search with: the least-loaded healthy pool member, or self."""
+        if self.pool is None:
+            yield self
+        else:
+            async with self.pool.acquire() as member:
+                yield member
 
     async def search_flights_for_date(self, origin: str, destination: str, date: str) -> list:
         NotImplementedError("This method should be implemented by subclasses.")
 
+    @asynccontextmanager
+    async def browser_page(self, headless = True, **launch_options):
+        """A page in its own context of the shared browser, or in a throwaway browser when no manager is set."""
+        if self.browser_manager:
+            async with self.browser_manager.page(proxy=self.proxy) as page:
+                yield page
+        else:
+            if self.proxy:
+                launch_options["proxy"] = playwright_proxy(self.proxy)
+            async with AsyncCamoufox(headless=headless, **launch_options) as browser:
+                yield await browser.new_page()
+
     async def headers_from_browser(self, url = None, headless = True) -> dict:
         if not url:
             url = self.login_url
-        async with AsyncCamoufox(headless=headless, os="linux") as browser:
-            print("login to virgin")
-            page = await browser.new_page()
+        async with self.browser_page(headless, os="linux") as page:
+            print(f"login to {self.program}")
 
             request_headers = {}
 
@@ -67,46 +166,522 @@ class Extractor:
 
             return self.session.headers
     
+    def export_session(self) -> dict:
+        """Serializable login state; subclasses extend it with their own search parameters."""
+        return {
+            "lifetime": self.session_lifetime,
+            "headers": dict(self.session.headers),
+            "cookies": [
+                {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+                for c in self.session.cookies.jar
+            ],
+        }
+
+    def import_session(self, state: dict):
+        self.session_lifetime = state.get("lifetime") or self.session_lifetime
+        self.session.headers.update(state.get("headers", {}))
+        for cookie in state.get("cookies", []):
+            self.session.cookies.set(
+                name=cookie["name"],
+                value=cookie["value"],
+                domain=cookie.get("domain"),
+                path=cookie.get("path", "/")
+            )
+
+    def save_session(self):
+        if self.session_store:
+            self.session_store.save(self.session_key, self.export_session())
+
+    async def validate_session(self) -> bool:
+        """Cheap probe telling whether the current credentials still work; subclasses override."""
+        return False
+
+    async def bootstrap(self, url = None, headless = True) -> bool:
+        """
+        Restore the stored session when it still validates, otherwise log in through the browser and store it.
+        Returns True when the stored session was reused.
+        """
+        state = self.session_store.load(self.session_key) if self.session_store else None
+        if state:
+            self.import_session(state)
+            try:
+                if await self.validate_session():
+                    print(f"{self.session_key}: reusing stored session")
+                    self.session_started = time.monotonic()
+                    return True
+            except Exception as e:
+                print(f"{self.session_key}: stored session probe failed: {e}")
+            print(f"{self.session_key}: stored session is stale, logging in")
+        with self.metrics.timer("browser_login_seconds", reason="bootstrap"):
+            await self.headers_from_browser(url or self.login_url, headless)
+        self.session_started = time.monotonic()
+        self.save_session()
+        return False
+
+    async def refresh(self):
+        """Re-acquire credentials for this program; subclasses override when login needs extra steps."""
+        await self.headers_from_browser(self.login_url)
+
+    async def refresh_session(self, generation: int = None):
+        """
+        Single-flight session refresh. Callers pass the session_generation they sent their failed
+        request with; if another task already refreshed since then, or a refresh finished less than
+        refresh_debounce seconds ago, they only wait for it and retry with the current credentials.
+        A failed request is not always an expired session, so the HTTP probe runs first and the
+        browser login only when it fails too.
+        """
+        if generation is None:
+            generation = self.session_generation
+        async with self.refresh_lock:
+            if generation != self.session_generation:
+                return
+            if time.monotonic() - self.last_refresh < self.refresh_debounce:
+                return
+            self.session_ready.clear()
+            still_valid = False
+            try:
+                if await self.probe_session():
+                    still_valid = True
+                    print(f"{self.session_key}: session still valid, skipping re-login")
+                    return
+                self.observe_expiry()
+                print(f"{self.session_key}: refreshing session")
+                self.limiter.feedback(expired=True)
+                with self.metrics.timer("browser_login_seconds", reason="refresh"):
+                    await self.refresh()
+                self.session_started = time.monotonic()
+                self.save_session()
+            finally:
+                if not still_valid:
+                    self.session_generation += 1
+                self.last_refresh = time.monotonic()
+                self.session_ready.set()
+
+    async def probe_session(self) -> bool:
+        """validate_session that reports failure instead of raising."""
+        try:
+            valid = await self.validate_session()
+        except Exception as e:
+            print(f"{self.session_key}: session probe failed: {e}")
+            valid = False
+        self.metrics.inc("session_probes_total", outcome="valid" if valid else "invalid")
+        return valid
+
+    def observe_expiry(self):
+        """Fold the age of the session that just expired into the lifetime estimate."""
+        lifetime = time.monotonic() - self.session_started
+        if self.session_lifetime is None:
+            self.session_lifetime = lifetime
+        else:
+            self.session_lifetime = (self.session_lifetime + lifetime) / 2
+
+    def keepalive_interval(self) -> float:
+        if self.session_lifetime is None:
+            return self.keepalive_default
+        return min(max(self.session_lifetime / 2, self.keepalive_min), self.keepalive_max)
+
+    async def keepalive(self):
+        """
+        Background task keeping an idle session warm: once no request went out for a keepalive
+        interval, send the cheap HTTP probe (its Set-Cookie responses refresh the jar) and store
+        the session; only a failed probe leads to a browser login.
+        """
+        if type(self).validate_session is Extractor.validate_session:
+            # No probe for this program: nothing cheaper than a browser login to keep it alive
+            return
+        while True:
+            idle = time.monotonic() - self.last_request
+            interval = self.keepalive_interval()
+            if idle < interval:
+                await asyncio.sleep(interval - idle)
+                continue
+            generation = await self.wait_for_session()
+            if await self.probe_session():
+                self.save_session()
+            else:
+                await self.refresh_session(generation)
+            # The probe may not go through post(), don't spin on it
+            self.last_request = time.monotonic()
+
+    async def wait_for_session(self) -> int:
+        """Park while a refresh is running; returns the generation of the credentials in use."""
+        await self.session_ready.wait()
+        return self.session_generation
+
     def get(self,url, headers=None):
         response = self.session.get(url, headers=headers)
         return response
-    
-    async def log_request(self, request):        
-        print(f"Request: {request.method} {request.url}")
 
-    async def log_response(self, response):
-        request = response.request
-        print(f"Request: {request.method} {request.url} - Status: {response.status_code}")
+    async def post(self, url, **kwargs):
+        """session.post that reports status and latency back to the adaptive limiter."""
+        start = self.last_request = time.monotonic()
+        self.log_request("POST", url, kwargs.get("data"), kwargs.get("json"))
+        try:
+            response = await self.session.post(url, **kwargs)
+        except Exception:
+            self.limiter.feedback(error=True)
+            self.log_response(None, time.monotonic() - start)
+            raise
+        latency = time.monotonic() - start
+        self.limiter.feedback(response.status_code, latency)
+        self.log_response(response, latency)
+        return response
 
-    async def save_to_gcs(self, data, origin, destination, date):
-        """Save results to Google Cloud Storage bucket"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    def log_request(self, method, url, data=None, json=None):
+        """Request metrics; data (bytes, str or a form dict) and json are the request's body arguments."""
+        self.metrics.inc("requests_sent_total", method=method)
+        if data is not None:
+            # A dict goes on the wire urlencoded, as a form
+            size = len(data) if isinstance(data, (bytes, str)) else len(urlencode(data))
+            self.metrics.inc("bytes_out_total", size)
+        elif json is not None:
+            self.metrics.inc("bytes_out_total", len(dumps(json)))
+
+    def log_response(self, response, latency):
+        """Response metrics; response is None when the request failed before one arrived."""
+        self.metrics.observe("request_seconds", latency)
+        if response is None:
+            self.metrics.inc("requests_total", status="error")
+            return
+        self.metrics.inc("requests_total", status=response.status_code)
+        self.metrics.inc("bytes_in_total", len(response.content))
+
+    async def save_to_gcs(self, data, origin, destination, date) -> asyncio.Future:
+        """
+        Queue results for upload to the Google Cloud Storage bucket; only waits when the upload queue is full.
+        Returns the future of the upload.
+        """
         blob_name = f"{self.program}/{date}_{origin}_{destination}.json"
-        blob = self.bucket.blob(blob_name)
-        
-        # Convert data to JSON string
-        json_data = json.dumps(data, default=str)
-        blob.upload_from_string(json_data, content_type='application/json')
-        
-        return blob_name
-
-    async def crawl(self, origins: List[str], destinations: List[str], start_day: int = 0, end_day: int = 360):
+
+        # Encode straight to bytes
+        json_data = dumps(data)
+        upload = await self.uploader.put(blob_name, json_data)
+        print(f"Queued for GCS: {blob_name}")
+        return upload
+
+    def mark_covered(self, origin: str, destination: str, dates):
+        for d in dates:
+            self.covered_keys.add((origin, destination, d))
+
+    def mark_answered(self, origin: str, destination: str, dates):
+        """
+        Called by a search once its response parsed successfully: `dates` (the searched date first)
+        are known answers for this route even where they have no results. crawl_one only records
+        availability and diffs snapshots for answered dates, so failures never read as empty.
+        """
+        self.answers[(origin, destination, dates[0])] = list(dates)
+
+    async def save_delta(self, delta, origin, destination, date) -> asyncio.Future:
+        """Queue the change between two versions of one (date, origin, destination) snapshot."""
+        blob_name = f"{self.program}/deltas/{date}_{origin}_{destination}.v{delta['version']}.json"
+        upload = await self.uploader.put(blob_name, dumps(delta))
+        print(f"Queued for GCS: {blob_name}")
+        return upload
+
+    async def crawl_one(self, origin: str, destination: str, date: str) -> Batch | None:
+        """
+        Search a single (date, origin, destination) key and queue its changed snapshots for upload;
+        errors are contained to the key. Returns None when the search failed or left the key
+        unanswered, otherwise a Batch of every record the response answered, with the dates whose
+        snapshot changed in batch.dates (all of them when no change index is set). Only those are
+        uploaded. Nothing counts as done yet, settle() records the key once stored.
+        """
+        try:
+            async with self.identity() as member:
+                result = await member.search_flights_for_date(origin, destination, date) or []
+                answered = self.answers.pop((origin, destination, date), None)
+                if self.pool:
+                    # Searches raise on transport, HTTP and session errors; an unanswered search
+                    # that returned (a cache hit, an error page for the route) is no fault of the member
+                    self.pool.report(member, True)
+            if answered is None:
+                return None
+
+            # One response can carry several departure dates, keep each under its own date
+            by_date = {d: [] for d in answered}
+            for r in result:
+                by_date.setdefault(r.date, []).append(r)
+
+            deltas = {}
+            if self.change_index:
+                deltas = await self.change_index.diff(self.program, origin, destination, by_date)
+            # Unchanged snapshots are not saved again, but their records are still passed on
+            changed = {d: rows for d, rows in by_date.items() if deltas.get(d, rows) is not None}
+            batch = Batch(
+                result,
+                program=self.program,
+                origin=origin,
+                destination=destination,
+                date=date,
+                counts={d: len(rows) for d, rows in by_date.items()},
+                dates=changed,
+                deltas={d: deltas[d] for d in changed if d in deltas},
+            )
+
+            if self.save_blobs:
+                for day, rows in changed.items():
+                    delta = deltas.get(day)
+                    if delta and delta["previous_version"] is not None:
+                        batch.uploads.append(await self.save_delta(delta, origin, destination, day))
+                    elif rows:
+                        # Save to GCS bucket
+                        batch.uploads.append(await self.save_to_gcs(rows, origin, destination, day))
+            return batch
+        except Exception as e:
+            self.answers.pop((origin, destination, date), None)
+            print(f"{self.program} Error fetching {origin} -> {destination} on {date}: {e}")
+            return None
+
+    async def commit(self, batch):
+        """
+        Record a stored batch in the indexes: its changed snapshots become the ones later answers
+        are diffed against, and every date its response answered becomes fresh.
+        """
+        if self.change_index and batch.deltas:
+            snapshots = {d: (delta["version"], []) for d, delta in batch.deltas.items()}
+            for r in batch:
+                if r.date in snapshots:
+                    snapshots[r.date][1].append(r)
+            await self.change_index.commit(self.program, batch.origin, batch.destination, snapshots)
+        if self.availability_index:
+            await self.availability_index.record(self.program, batch.origin, batch.destination, batch.counts)
+
+    async def settle(self, batch, finished, failed=None):
+        """
+        Wait until every upload holding the batch has landed, then commit it and run finished(key)
+        for each date its response answered. Keys of a batch that could not be stored go to
+        failed(key) instead, so they are searched again.
+        """
+        keys = [(d, batch.origin, batch.destination) for d in batch.counts]
+        try:
+            stored = all(await asyncio.gather(*batch.uploads))
+            if stored:
+                await self.commit(batch)
+        except Exception as e:
+            print(f"{self.program} Error committing {batch.origin} -> {batch.destination} on {batch.date}: {e}")
+            stored = False
+        if not stored:
+            print(f"[red]{self.program}: {batch.origin} -> {batch.destination} on {batch.date} was not stored, leaving it open")
+        for key in keys:
+            if stored:
+                await finished(key)
+            elif failed:
+                await failed(key)
+
+    async def finish_crawl(self):
+        """Hook run once when a crawl ends, however it ends; subclasses persist their own caches here."""
+        if self.sink:
+            await self.sink.close()
+        await self.uploader.flush()
+        for identity in self.identities:
+            identity.save_session()
+        if self.pool:
+            await self.pool.close()
+        if self.rate_store:
+            self.rate_store.save(self.program, self.limiter.rate)
+
+    def restore_rate(self):
+        """Start every identity's limiter from the rate the program settled on last run."""
+        if self.rate_store:
+            rate = self.rate_store.load(self.program, self.limiter.rate)
+            for identity in self.identities:
+                identity.limiter.rate = rate
+
+    async def crawl_keys(self, next_key, finished, failed=None, workers: int = None):
+        """
+        Run the worker pool over keys handed out by next_key() (None once there are no more)
+        and yield each search's batch as soon as it completes, so consumers see the first
+        batch right away and memory stays flat however large the crawl is. The batch queue
+        is bounded: a slow consumer pauses the workers instead of buffering results.
+        A key is finished(key) only once it is stored: after the consumer has handled its batch
+        and every upload holding it (its blobs, or its shard in self.sink) has landed. Keys whose
+        search or storage failed go to failed(key).
+        """
+        workers = max(1, workers or self.workers)
+        batches = asyncio.Queue(maxsize=workers * 2)
+        done = object()
+        settling = set()
+
+        async def worker():
+            while (key := await next_key()) is not None:
+                d, origin, destination = key
+                with self.metrics.timer("search_seconds"):
+                    batch = await self.crawl_one(origin, destination, d)
+                self.metrics.inc("searches_total")
+                if batch is None:
+                    if failed:
+                        await failed(key)
+                    continue
+                self.metrics.inc("results_total", len(batch))
+                await batches.put(batch)
+
+        async def run():
+            try:
+                await asyncio.gather(*(worker() for _ in range(workers)))
+            finally:
+                await batches.put(done)
+
+        runner = asyncio.create_task(run())
+        keepalives = [asyncio.create_task(identity.keepalive()) for identity in self.identities]
+        total = 0
+        try:
+            while (batch := await batches.get()) is not done:
+                total += len(batch)
+                yield batch
+                # Its keys settle once the consumer has handled it and its uploads have landed
+                if self.sink and batch.dates:
+                    batch.uploads.append(await self.sink.write(batch))
+                task = asyncio.create_task(self.settle(batch, finished, failed))
+                settling.add(task)
+                task.add_done_callback(settling.discard)
+            await runner
+        finally:
+            if not runner.done():
+                # Consumer stopped early: stop the workers, and make room for the sentinel
+                runner.cancel()
+                while not batches.empty():
+                    batches.get_nowait()
+                try:
+                    await runner
+                except asyncio.CancelledError:
+                    pass
+            if self.sink:
+                # The last batches wait on the shard still being buffered
+                await self.sink.flush_shard()
+            await asyncio.gather(*settling, return_exceptions=True)
+            for task in keepalives:
+                task.cancel()
+            await asyncio.gather(*keepalives, return_exceptions=True)
+            await self.finish_crawl()
+            print(f"✅ {self.program}, results: {total}, settled rate: {self.limiter.rate:.0f}/{self.limiter.time_period:.0f}s")
+
+    def crawl_plan(self, origins: List[str], destinations: List[str], start_day: int = 0, end_day: int = 360):
+        """Lazy (date, origin, destination) keys of a crawl."""
+        return (
+            (d, origin, destination)
+            for d in date_range(days=360, start=start_day, end=end_day)
+            for origin in origins
+            for destination in destinations
+        )
+
+    async def crawl_iter(self, origins: List[str], destinations: List[str], start_day: int = 0, end_day: int = 360, workers: int = None):
+        """Crawl the date x route matrix in this process, yielding batches as they complete."""
+        self.restore_rate()
+        if self.availability_index:
+            # Keys answered recently enough (by this or an earlier run) need no request
+            fresh = await self.availability_index.fresh_keys(self.program)
+            self.covered_keys.update(fresh)
+            print(f"{self.program}: {len(fresh)} keys still fresh, skipping them")
+        if self.checkpoint:
+            self.checkpoint.open()
+        # Shared lazy iterator: each worker pulls the next key when it frees up,
+        # while self.limiter keeps the overall request rate in check.
+        keys = self.crawl_plan(origins, destinations, start_day, end_day)
+        if self.scheduler:
+            keys = await self.schedule(
+                key for key in keys
+                if (key[1], key[2], key[0]) not in self.covered_keys
+                and (not self.checkpoint or self.checkpoint.should_run(*key))
+            )
+            keys = iter([key for key, _ in keys])
+
+        async def next_key():
+            for d, origin, destination in keys:
+                if (origin, destination, d) in self.covered_keys:
+                    continue
+                if self.checkpoint:
+                    if not self.checkpoint.should_run(d, origin, destination):
+                        continue
+                    await self.checkpoint.start(d, origin, destination)
+                return d, origin, destination
+            return None
+
+        async def finished(key):
+            if self.checkpoint:
+                await self.checkpoint.done(*key)
+
+        # Failed keys are simply not marked done: a resumed crawl searches them again
+        completed = False
+        try:
+            async with aclosing(self.crawl_keys(next_key, finished, workers=workers)) as batches:
+                async for batch in batches:
+                    yield batch
+            completed = True
+        finally:
+            if self.checkpoint:
+                await self.checkpoint.close(completed=completed)
+
+    async def schedule(self, keys) -> list:
+        """[(key, priority)] from the scheduler, highest first; logs how much of the plan it kept."""
+        keys = list(keys)
+        ranked = await self.scheduler.rank(self.program, keys)
+        print(f"{self.program}: {len(ranked)} of {len(keys)} keys scheduled by priority")
+        return ranked
+
+    async def enqueue_tasks(self, task_queue, origins: List[str], destinations: List[str], start_day: int = 0, end_day: int = 360) -> int:
+        """Put this program's keys on a shared TaskQueue, leaving out the ones still fresh in the availability index."""
+        fresh = await self.availability_index.fresh_keys(self.program) if self.availability_index else set()
+        keys = (
+            (d, origin, destination)
+            for d, origin, destination in self.crawl_plan(origins, destinations, start_day, end_day)
+            if (origin, destination, d) not in fresh
+        )
+        if self.scheduler:
+            # Workers lease the highest priority keys first. Every node ranks (and samples) its
+            # own plan, the budget caps the run's keys however many of them enqueue
+            ranked = await self.schedule(keys)
+            return await task_queue.enqueue(
+                self.program, (key for key, _ in ranked), dict(ranked), limit=self.scheduler.budget
+            )
+        return await task_queue.enqueue(self.program, keys)
+
+    async def crawl_leased(self, task_queue, owner: str, workers: int = None, poll_interval: float = 5):
+        """
+        Crawl keys leased from a shared TaskQueue, side by side with any other process on the
+        same queue. Leases are kept alive while this process works, each key is completed once
+        it is stored and released for another attempt when it fails; the crawl ends when the
+        run has no open keys left.
+        """
+        self.restore_rate()
+
+        async def next_key():
+            while True:
+                key = await task_queue.lease(self.program, owner)
+                if key is None:
+                    # Keys leased by other nodes may still come back if their owner dies
+                    if not await task_queue.has_open(self.program, owner):
+                        return None
+                    await asyncio.sleep(poll_interval)
+                    continue
+                d, origin, destination = key
+                if (origin, destination, d) in self.covered_keys:
+                    # Answered by a multi-day response this process already made; the lease is
+                    # completed or released when that response's batch settles
+                    continue
+                return key
+
+        async def finished(key):
+            await task_queue.complete(self.program, *key)
+
+        async def failed(key):
+            await task_queue.release(self.program, owner, *key)
+
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(task_queue.lease_ttl / 3)
+                await task_queue.heartbeat(owner)
+
+        beat = asyncio.create_task(heartbeat())
+        try:
+            async with aclosing(self.crawl_keys(next_key, finished, failed, workers)) as batches:
+                async for batch in batches:
+                    yield batch
+        finally:
+            beat.cancel()
+            print(f"{self.program} queue ({task_queue.run}): {await task_queue.counts(self.program)}")
+
+    async def crawl(self, origins: List[str], destinations: List[str], start_day: int = 0, end_day: int = 360, workers: int = None):
         all_results = []
-        for d in date_range(days=360, start=start_day, end=end_day):
-            for origin in origins:
-                for destination in destinations:
-                    try:
-                        # print(f"Fetching {origin} -> {destination} on {d} for {self.program}")
-                        result = await self.search_flights_for_date(origin, destination, d)
-                        if result:
-                            all_results.extend(result)
-                            # Save to GCS bucket
-                            blob_name = await self.save_to_gcs(result, origin, destination, d)
-                            print(f"Saved to GCS: {blob_name}")
-                        # print(f"Fetched {result} for {origin} -> {destination} on {d} for {self.program}")
-                    except Exception as e:
-                        print(f"{self.program} Error fetching {origin} -> {destination} on {d}: {e}")
-                    
-
-        print(f"✅ {self.program}, all_results: {len(all_results)}")
-        return all_results
\ No newline at end of file
+        async for batch in self.crawl_iter(origins, destinations, start_day, end_day, workers):
+            all_results.extend(batch)
+        return all_results
@@ -2,9 +2,24 @@ from virgin_extractor import VirginExtractor
 from cathay_extractor import CathayExtractor
 from qantas_extractor import QantasExtractor
 import asyncio
+from contextlib import aclosing
 from rich import print
 import os
 from dotenv import load_dotenv
+from utils.uploader import LocalBucket
+from utils.session_store import SessionStore
+from utils.browser_manager import BrowserManager
+from utils.rate_limiter import RateStore
+from utils.availability_index import AvailabilityIndex
+from utils.result_store import ResultStore
+from utils.shard_sink import ShardSink
+from utils.change_index import ChangeIndex
+from utils.checkpoint import Checkpoint
+from utils.task_queue import TaskQueue
+from utils.scheduler import PriorityScheduler
+from utils.metrics import MetricsExporter
+from datetime import datetime
+import socket
 
 async def main():
     load_dotenv()
@@ -12,29 +27,171 @@ async def main():
     end_day = int(os.getenv("END_DAY"))
     origins = os.getenv("ORIGINS").split(",")
     destinations = os.getenv("DESTINATIONS").split(",")
+    # Write results to a local directory instead of GCS, e.g. for dry runs
+    local_bucket_dir = os.getenv("LOCAL_BUCKET_DIR")
+    bucket = LocalBucket(local_bucket_dir) if local_bucket_dir else None
+    session_store = SessionStore(
+        os.getenv("SESSION_STORE", "db/sessions.json"),
+        ttl=int(os.getenv("SESSION_TTL", 6 * 3600)),
+    )
 
-    qantas = QantasExtractor()
-    await qantas.headers_from_browser(headless=True)
+    # One warm browser for all logins and any re-authentication during the crawl
+    browser_manager = BrowserManager(headless=os.getenv("BROWSER_HEADLESS", "virtual"))
+    # Each program starts from the rate its limiter settled on in the previous run
+    rate_store = RateStore(os.getenv("RATE_STORE", "db/rates.json"))
+    # Shared by all programs; keys answered within the TTLs are skipped on re-runs
+    availability_index = AvailabilityIndex(
+        os.getenv("AVAILABILITY_INDEX", "db/availability.db"),
+        empty_ttl=int(os.getenv("EMPTY_TTL", 24 * 3600)),
+        seen_ttl=int(os.getenv("SEEN_TTL", 6 * 3600)),
+    )
+    # Local, queryable copy of every result next to the bucket
+    result_store = ResultStore(os.getenv("RESULT_STORE", "db/results.db"))
+    # Content hashes of the last stored snapshot per key: unchanged availability is not written again
+    change_index = ChangeIndex(os.getenv("CHANGE_INDEX", "db/changes.db"))
+    # SCHEDULE=priority: near, volatile and stale keys first; REQUEST_BUDGET caps the keys per program and run
+    scheduler = None
+    if os.getenv("SCHEDULE", "priority") == "priority":
+        budget = os.getenv("REQUEST_BUDGET")
+        scheduler = PriorityScheduler(
+            availability_index,
+            change_index,
+            budget=int(budget) if budget else None,
+            horizon_days=float(os.getenv("PRIORITY_HORIZON_DAYS", 60)),
+        )
+    # "shards": a few compressed objects per program and run; "blobs": one object per route and date
+    output = os.getenv("OUTPUT", "shards")
+    options = dict(
+        save_blobs=output == "blobs",
+        bucket=bucket,
+        session_store=session_store,
+        browser_manager=browser_manager,
+        rate_store=rate_store,
+        availability_index=availability_index,
+        change_index=change_index,
+        scheduler=scheduler,
+    )
 
-    virgin = VirginExtractor()
-    virgin_url = "https://book.virginaustralia.com/dx/VADX/1"
-    await virgin.headers_from_browser(virgin_url, "virtual")
-    await virgin.preflight_check()
+    # {PROGRAM}_PROXIES: comma separated proxies, one identity (session, cookies, login) per proxy
+    def proxies(name):
+        return [p for p in os.getenv(name, "").split(",") if p] or [None]
+
+    qf_proxies, va_proxies, cx_proxies = proxies("QF_PROXIES"), proxies("VA_PROXIES"), proxies("CATHAY_PROXIES")
+    calendar_mode = os.getenv("QF_CALENDAR_MODE", "false").lower() == "true"
+    qantas = QantasExtractor(
+        proxy=qf_proxies[0],
+        workers=int(os.getenv("QF_WORKERS", 4)),
+        calendar_mode=calendar_mode,
+        **options,
+    )
+    virgin = VirginExtractor(proxy=va_proxies[0], workers=int(os.getenv("VA_WORKERS", 4)), **options)
+    # Every concurrent Cathay search checks out its own TAB_ID; workers beyond tabs x identities wait for one
+    cathay_tabs = int(os.getenv("CATHAY_TABS", 4))
+    cathay = CathayExtractor(
+        proxy=cx_proxies[0],
+        workers=int(os.getenv("CATHAY_WORKERS", 4)),
+        tab_pool_size=cathay_tabs,
+        **options,
+    )
 
-    cathay = CathayExtractor()
+    # Pool members only search: results, indexes and uploads stay with the primary
+    member_options = dict(session_store=session_store, browser_manager=browser_manager)
+    qantas.add_members(
+        QantasExtractor(proxy=p, calendar_mode=calendar_mode, bucket=qantas.bucket, **member_options) for p in qf_proxies[1:]
+    )
+    virgin.add_members(VirginExtractor(proxy=p, bucket=virgin.bucket, **member_options) for p in va_proxies[1:])
+    cathay.add_members(
+        CathayExtractor(proxy=p, tab_pool_size=cathay_tabs, bucket=cathay.bucket, **member_options) for p in cx_proxies[1:]
+    )
+
+    # METRICS_FORMAT=prometheus writes a textfile-collector file instead of a JSON snapshot
+    metrics_format = os.getenv("METRICS_FORMAT", "json")
+    exporter = MetricsExporter(
+        {extractor.program: extractor.metrics for extractor in (virgin, cathay, qantas)},
+        path=os.getenv("METRICS_PATH", "db/metrics.prom" if metrics_format == "prometheus" else "db/metrics.json"),
+        interval=float(os.getenv("METRICS_INTERVAL", 30)),
+        format=metrics_format,
+    )
+    exporter.start()
+
+    virgin_url = "https://book.virginaustralia.com/dx/VADX/1"
     cathay_url = "https://www.cathaypacific.com/cx/en_CN/sign-in.html?loginreferrer=https%3A%2F%2Fwww.cathaypacific.com%2Fcx%2Fen_CN%2Fbook-a-trip%2Fredeem-flights%2Fredeem-flight-awards.html"
-    await cathay.headers_from_browser(cathay_url, True)
+
+    async def bootstrap_virgin(identity):
+        if not await identity.bootstrap(virgin_url, "virtual"):
+            await identity.preflight_check()
+
+    # Every identity logs in (or restores its stored session) on its own
+    await asyncio.gather(
+        *(identity.bootstrap(headless=True) for identity in qantas.identities),
+        *(bootstrap_virgin(identity) for identity in virgin.identities),
+        *(identity.bootstrap(cathay_url, True) for identity in cathay.identities),
+    )
+
+    run_id = datetime.now().strftime("%Y%m%dT%H%M%S")
+    # TASK_QUEUE: share the crawl with every other process on the same queue file and run
+    task_queue_path = os.getenv("TASK_QUEUE")
+    task_queue = None
+    owner = f"{socket.gethostname()}-{os.getpid()}"
+    if task_queue_path:
+        task_queue = TaskQueue(
+            task_queue_path,
+            run=os.getenv("TASK_RUN", datetime.now().strftime("%Y%m%d")),
+            lease_ttl=int(os.getenv("TASK_LEASE_TTL", 120)),
+        )
+        for extractor in (virgin, cathay, qantas):
+            added = await extractor.enqueue_tasks(task_queue, origins, destinations, start_day=start_day, end_day=end_day)
+            print(f"{extractor.program}: {added} keys added to queue run {task_queue.run}")
+        # Every node writes its own shards
+        run_id = f"{run_id}-{owner}"
+    else:
+        # Progress log per program; RESUME=true picks a crashed crawl up where it stopped
+        checkpoint_dir = os.getenv("CHECKPOINT_DIR", "db/checkpoints")
+        resume = os.getenv("RESUME", "false").lower() == "true"
+        for extractor in (virgin, cathay, qantas):
+            extractor.checkpoint = Checkpoint(f"{checkpoint_dir}/{extractor.program}.log", resume=resume)
+
+    if output == "shards":
+        # Each program stores its batches in the run's shards; a key is done once its shard is uploaded
+        for extractor in (virgin, cathay, qantas):
+            extractor.sink = ShardSink(extractor.uploader, extractor.program, run_id)
+
+    async def consume(extractor):
+        # Index each batch locally as it arrives
+        count = 0
+        if task_queue:
+            batches = extractor.crawl_leased(task_queue, owner)
+        else:
+            batches = extractor.crawl_iter(origins, destinations, start_day=start_day, end_day=end_day)
+        # Close the crawl here, even when a write raises: its cleanup (last shard, manifest,
+        # checkpoint) must run while the uploaders still take new work
+        async with aclosing(batches):
+            async for batch in batches:
+                await result_store.write(batch)
+                count += len(batch)
+        return count
 
     try:
         results = await asyncio.gather(
-            virgin.crawl(origins=origins, destinations=destinations, start_day=start_day, end_day=end_day),
-            cathay.crawl(origins, destinations, start_day=start_day, end_day=end_day),
-            qantas.crawl(origins,destinations, start_day=start_day, end_day=end_day),
+            consume(virgin),
+            consume(cathay),
+            consume(qantas),
             return_exceptions=True
         )
     except Exception as e:
         print("[red]Gather failed:", repr(e))
         results = []
+    finally:
+        # Every crawl has written its last shard and manifest; make sure every queued upload lands before the process exits
+        await asyncio.gather(virgin.uploader.close(), cathay.uploader.close(), qantas.uploader.close())
+        await browser_manager.close()
+        await availability_index.close()
+        await result_store.close()
+        await change_index.close()
+        if task_queue:
+            await task_queue.close()
+        # Last snapshot and the per-program summary
+        await exporter.close()
 
     return results
 
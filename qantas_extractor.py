@@ -5,29 +5,47 @@ import httpx
 from datetime import date, timedelta
 from urllib.parse import urlencode, parse_qsl
 from datetime import datetime
-from curl_cffi import AsyncSession, CurlHttpVersion
+from curl_cffi import CurlHttpVersion
+from utils.utils import parse_date
+from utils.codec import loads
+from utils.records import FlightResult
 
 
-
-from camoufox.async_api import AsyncCamoufox
-
 class QantasExtractor(Extractor):
-    def __init__(self, proxy: str = None):
-        super().__init__(proxy)
+    shared_attributes = Extractor.shared_attributes + ("no_results_cache",)
+
+    def __init__(self, proxy: str = None, calendar_mode: bool = False, **kwargs):
+        super().__init__(proxy, **kwargs)
         self.program = "QF"
         self.login_url = "https://www.qantas.com/en-au"
         self.search_url = ""
         self.search_body = ""
         self.no_results_cache = set()
-        self.session = AsyncSession(impersonate="firefox135", default_headers=True, http_version=CurlHttpVersion.V2_0)
+        # Flexible-date searches answer for a whole window; in calendar mode the window days
+        # the page returned flights for are harvested too. The crawl still steps one day at a
+        # time, so every day the page says nothing about gets its own search.
+        self.calendar_days = 7
+        self.calendar_mode = calendar_mode
+        self.session = self.new_session(self.proxy, CurlHttpVersion.V2_0)
+
+    def window_dates(self, start_date_str):
+        start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+        return [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(self.calendar_days)]
 
     def mark_7days_no_results(self, origin, destination, start_date_str):
         """Mark 7 days starting from start_date_str as no results."""
-        start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
-        for i in range(7):
-            day = (start_date + timedelta(days=i)).strftime("%Y-%m-%d")
+        for day in self.window_dates(start_date_str):
             self.no_results_cache.add((origin, destination, day))
 
+    def itinerary_date(self, itinerary, default):
+        """Departure date of an itinerary's first segment, falling back to the searched date."""
+        first = (itinerary.get('segments') or [{}])[0]
+        for key in ('beginDate', 'departureDate', 'beginDateTime'):
+            day = parse_date(first.get(key))
+            if day:
+                return day
+        return default
+
     def update_search_body(self, search_body: str, **updates) -> str:
         params = dict(parse_qsl(search_body))
         for key, value in updates.items():
@@ -62,13 +80,12 @@ class QantasExtractor(Extractor):
         return f"{base_url}?{urlencode(params)}"
 
     async def headers_from_browser(self, url = None, headless = True) -> dict:
-        async with AsyncCamoufox(os=["windows", "macos", "linux"],
-                                 headless=headless, 
-                                #  main_world_eval=True,
-                                 humanize=True,
-                                 geoip=True,
-            ) as browser:
-            page = await browser.new_page()
+        async with self.browser_page(headless,
+                                     os=["windows", "macos", "linux"],
+                                    #  main_world_eval=True,
+                                     humanize=True,
+                                     geoip=True,
+            ) as page:
             url = self.generate_login_url()
             async def handler_request(req):
                 if (
@@ -120,86 +137,127 @@ class QantasExtractor(Extractor):
 
             return self.session.headers
 
+    def export_session(self) -> dict:
+        state = super().export_session()
+        state.update({"search_url": self.search_url, "search_body": self.search_body})
+        return state
+
+    def import_session(self, state: dict):
+        super().import_session(state)
+        self.search_url = state.get("search_url", "")
+        self.search_body = state.get("search_body", "")
+
+    async def validate_session(self) -> bool:
+        # Replay the captured search; GERR means the session behind it has expired
+        if not self.search_url or not self.search_body:
+            return False
+        response = await self.post(self.search_url, data=self.search_body)
+        if response.status_code >= 400:
+            return False
+        return loads(response.content).get('modelInput', {}).get('pageCode') != "GERR"
+
+    async def refresh(self):
+        await self.headers_from_browser(headless=True)
+
     async def search_flights_for_date(
         self, origin: str, destination: str, date: str) -> List[dict]:
         if (origin, destination, date) in self.no_results_cache:
             return []
         async with self.limiter:
-            data = self.update_search_body(
-                self.search_body,
-                B_DATE_1=date.replace("-", "") + "0000",
-                B_LOCATION_1=origin,
-                E_LOCATION_1=destination,
-                )
-            try:
-                response = await self.session.post(
-                    self.search_url,
-                    data=data,
-                )
-                results = []
-                data = response.json().get('modelInput', {})
-                if data.get('pageCode') == "FFCO":
-                    bounds = data.get('availability', {}).get('bounds', [])
-                    if not bounds:
-                        return 
-
-                    bound = bounds[0]
-                    flights = bound.get('flights', {})
-                    if flights:
-                        itineraries = bound.get('listItineraries', {}).get('itineraries', [])
-                    else:
-                        return
-                    for item_id, flight in flights.items():
-                        rec = flight.get('listRecommendation', {}).get('ACEBUS')
-                        if not rec or rec.get('isRewardPlus'):
-                            continue
-                        else:
-                            points = rec.get('priceForAll', {}).get('convertedBaseFare', '')
-
-                        itinerary = next((it for it in itineraries if it.get('itemId') == item_id), None)
-                        if not itinerary:
-                            continue
-
-                        segments = itinerary.get('segments', [])
-                        if not segments:
-                            continue
-                        parts = []
-                        for i, seg in enumerate(segments):
-                            airline = seg.get('codeForIcon', '')
-                            flight_no = seg.get('flightNumber', '')
-                            parts.append(f"{airline}{flight_no}")
-                            if i < len(segments) - 1:
-                                stop_city = seg.get('endLocationCode', '')[:3]
-                                parts.append(stop_city)
-
-                        flight_data = "_".join(filter(None, parts))  # join and skip blanks
-                        results.append({
-                            "origin": origin,
-                            "destination": destination,
-                            "date": date,
-                            "cabin": "Bus",
-                            "points": points,
-                            "route": flight_data,
-                            "stops": len(segments) - 1,
-                            "program": self.program
-                        })
-                else:
+            # A GERR page means the session expired: refresh once (or wait for the
+            # refresh another worker started) and retry with the new search_body
+            for attempt in range(2):
+                generation = await self.wait_for_session()
+                data = self.update_search_body(
+                    self.search_body,
+                    B_DATE_1=date.replace("-", "") + "0000",
+                    B_LOCATION_1=origin,
+                    E_LOCATION_1=destination,
+                    )
+                try:
+                    response = await self.post(
+                        self.search_url,
+                        data=data,
+                    )
+                    with self.metrics.timer("parse_seconds", stage="decode"):
+                        data = loads(response.content).get('modelInput', {})
+                    if data.get('pageCode') == "FFCO":
+                        with self.metrics.timer("parse_seconds", stage="extract_offers"):
+                            results = self.extract_offers(data, origin, destination, date) or []
+                        answered = [date]
+                        if self.calendar_mode:
+                            # Only window days the page returned flights for count as answered;
+                            # nothing in it says the other days have no seats. Days an earlier
+                            # response of this run already answered are left to that answer.
+                            window = set(self.window_dates(date)) - {date}
+                            extra = {r.date for r in results} & window
+                            seen = {d for d in extra if (origin, destination, d) in self.covered_keys}
+                            extra -= seen
+                            results = [r for r in results if r.date not in seen]
+                            answered += sorted(extra)
+                            self.mark_covered(origin, destination, answered)
+                        self.mark_answered(origin, destination, answered)
+                        return results
                     if data.get('pageCode') != "GERR":
+                        # Not a results page: skip the window for this run, but record nothing about it
                         self.mark_7days_no_results(origin, destination, date)
-                    else:
-                        await self.headers_from_browser(headless=True)
-                return results
-            
-            except httpx.TimeoutException as e:
-                print(f"Timeout QF fetching for {origin} → {destination} on {date}: {e}")
-                await self.headers_from_browser(headless=True)
-                return []
-            except Exception as e:
-                print(f"Error QF fetching for {origin} → {destination} on {date}:{type(e)}: {e}")
-                await self.headers_from_browser(headless=True)
-                return []
-
-    async def log_request(self, request):        
-        pass
-    async def log_response(self, response):
-        pass
\ No newline at end of file
+                        return []
+                    await self.refresh_session(generation)
+
+                except httpx.TimeoutException as e:
+                    print(f"Timeout QF fetching for {origin} → {destination} on {date}: {e}")
+                    await self.refresh_session(generation)
+                    raise
+                except Exception as e:
+                    print(f"Error QF fetching for {origin} → {destination} on {date}:{type(e)}: {e}")
+                    await self.refresh_session(generation)
+                    raise
+            raise RuntimeError("QF session still expired (GERR) after a refresh")
+
+    def extract_offers(self, data, origin, destination, date):
+        results = []
+        bounds = data.get('availability', {}).get('bounds', [])
+        if not bounds:
+            return 
+
+        bound = bounds[0]
+        flights = bound.get('flights', {})
+        if flights:
+            itineraries = bound.get('listItineraries', {}).get('itineraries', [])
+        else:
+            return
+        for item_id, flight in flights.items():
+            rec = flight.get('listRecommendation', {}).get('ACEBUS')
+            if not rec or rec.get('isRewardPlus'):
+                continue
+            else:
+                points = rec.get('priceForAll', {}).get('convertedBaseFare', '')
+
+            itinerary = next((it for it in itineraries if it.get('itemId') == item_id), None)
+            if not itinerary:
+                continue
+
+            segments = itinerary.get('segments', [])
+            if not segments:
+                continue
+            parts = []
+            for i, seg in enumerate(segments):
+                airline = seg.get('codeForIcon', '')
+                flight_no = seg.get('flightNumber', '')
+                parts.append(f"{airline}{flight_no}")
+                if i < len(segments) - 1:
+                    stop_city = seg.get('endLocationCode', '')[:3]
+                    parts.append(stop_city)
+
+            flight_data = "_".join(filter(None, parts))  # join and skip blanks
+            results.append(FlightResult(
+                origin=origin,
+                destination=destination,
+                date=self.itinerary_date(itinerary, date) if self.calendar_mode else date,
+                cabin="Bus",
+                points=points,
+                route=flight_data,
+                stops=len(segments) - 1,
+                program=self.program,
+            ))
+        return results
@@ -0,0 +1,17 @@
+from stubs import StubServer
+import pytest
+
+
+@pytest.fixture
+def stub_server():
+    """Factory starting StubServers that are stopped after the test."""
+    servers = []
+
+    def start(respond, delay: float = 0.0) -> StubServer:
+        server = StubServer(respond, delay).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
@@ -0,0 +1,127 @@
+"""
+Local stand-ins for the outside world: a stub search API, forward proxies in front of it, and an
+extractor that searches the stub the way the real programs search theirs.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from extractor import Extractor
+from utils.codec import dumps, loads
+from utils.rate_limiter import AdaptiveLimiter
+from utils.records import FlightResult
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+class StubServer:
+    """
+    Threaded HTTP server on localhost. Every POST goes to respond(path, body) -> (status, payload),
+    after `delay` seconds; requests and the highest number in flight at once are recorded.
+    """
+
+    def __init__(self, respond, delay: float = 0.0):
+        self.respond = respond
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with server.lock:
+                    server.requests.append((self.path, body))
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    time.sleep(server.delay)
+                    status, payload = server.respond(self.path, body)
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def search_api(fail_dates=()):
+    """respond() of a search API: one flight per searched date, HTTP 500 for dates in fail_dates."""
+
+    def respond(path, body):
+        if path.endswith("/validate"):
+            return 200, b"{}"
+        query = loads(body)
+        if query["date"] in fail_dates:
+            return 500, b'{"error": "upstream"}'
+        flight = {"route": "ST100", "points": 60000}
+        return 200, dumps({"flights": [flight]})
+
+    return respond
+
+
+def forward_proxy(name: str, down: bool = False):
+    """respond() of a forward proxy: relays the absolute-URI request upstream, or answers 502 when down."""
+
+    def respond(path, body):
+        if down:
+            return 502, b'{"error": "bad gateway"}'
+        request = urllib.request.Request(path, data=body, method="POST", headers={"X-Via": name})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    return respond
+
+
+class StubExtractor(Extractor):
+    """Searches a StubServer through post() and the limiter, like the real programs do."""
+
+    def __init__(self, url: str, proxy: str = None, **kwargs):
+        super().__init__(proxy, **kwargs)
+        self.program = "STUB"
+        self.url = url
+        # Tests should not wait on the production request rate
+        self.limiter = AdaptiveLimiter(rate=600, time_period=1, max_rate=600)
+        self.logins = 0
+
+    async def validate_session(self) -> bool:
+        response = await self.post(f"{self.url}/validate", data=b"{}")
+        return response.status_code < 400
+
+    async def refresh(self):
+        self.logins += 1
+
+    async def search_flights_for_date(self, origin: str, destination: str, date: str) -> list:
+        async with self.limiter:
+            response = await self.post(
+                f"{self.url}/search",
+                data=dumps({"origin": origin, "destination": destination, "date": date}),
+            )
+            response.raise_for_status()
+            flights = loads(response.content)["flights"]
+        self.mark_answered(origin, destination, [date])
+        return [
+            FlightResult(origin, destination, date, "J", f["points"], f["route"], 0, self.program)
+            for f in flights
+        ]
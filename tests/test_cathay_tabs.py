@@ -0,0 +1,94 @@
+from cathay_extractor import CathayExtractor
+from utils.uploader import LocalBucket
+import asyncio
+import pytest
+
+
+class TabbedCathay(CathayExtractor):
+    """CathayExtractor minting numbered TAB_IDs instead of calling the booking site."""
+
+    def __init__(self, bucket, tab_pool_size: int = 2, failed_mints: int = 0):
+        super().__init__(tab_pool_size=tab_pool_size, bucket=bucket)
+        self.failed_mints = failed_mints
+        self.minted = 0
+        self.logins = 0
+
+    async def request_tab_id(self):
+        if self.failed_mints:
+            self.failed_mints -= 1
+            return None
+        self.minted += 1
+        return f"tab{self.minted}"
+
+    async def validate_session(self) -> bool:
+        return False
+
+    async def refresh(self):
+        self.logins += 1
+
+
+@pytest.fixture
+def cathay(tmp_path, monkeypatch):
+    monkeypatch.setenv("CATHAY_MILES_CACHE", str(tmp_path / "miles.json"))
+
+    def build(**kwargs):
+        return TabbedCathay(LocalBucket(tmp_path / "bucket"), **kwargs)
+
+    return build
+
+
+def test_an_idle_tab_of_the_current_session_is_reused(cathay):
+    async def scenario():
+        extractor = cathay()
+        tab = await extractor.checkout_tab(0)
+        await extractor.checkin_tab(tab, 0, True)
+        again = await extractor.checkout_tab(0)
+        return tab, again, extractor.minted
+
+    assert asyncio.run(scenario()) == ("tab1", "tab1", 1)
+
+
+def test_tabs_are_minted_up_to_the_pool_size_then_waited_for(cathay):
+    async def scenario():
+        extractor = cathay(tab_pool_size=2)
+        first = await extractor.checkout_tab(0)
+        second = await extractor.checkout_tab(0)
+        third = asyncio.create_task(extractor.checkout_tab(0))
+        await asyncio.sleep(0.05)
+        waited = not third.done()
+        await extractor.checkin_tab(first, 0, True)
+        return (first, second, await asyncio.wait_for(third, 1)), waited, extractor.minted
+
+    assert asyncio.run(scenario()) == (("tab1", "tab2", "tab1"), True, 2)
+
+
+def test_tabs_minted_under_an_old_session_are_dropped(cathay):
+    async def scenario():
+        extractor = cathay()
+        tab = await extractor.checkout_tab(0)
+        await extractor.checkin_tab(tab, 0, True)
+        fresh = await extractor.checkout_tab(1)
+        return fresh, extractor.tab_count, extractor.idle_tabs
+
+    assert asyncio.run(scenario()) == ("tab2", 1, [])
+
+
+def test_a_failed_tab_gives_its_slot_to_a_new_one(cathay):
+    async def scenario():
+        extractor = cathay(tab_pool_size=1)
+        tab = await extractor.checkout_tab(0)
+        await extractor.checkin_tab(tab, 0, False)
+        return await extractor.checkout_tab(0), extractor.tab_count
+
+    assert asyncio.run(scenario()) == ("tab2", 1)
+
+
+def test_a_failed_mint_frees_its_slot_and_asks_for_a_login(cathay):
+    async def scenario():
+        extractor = cathay(tab_pool_size=1, failed_mints=1)
+        failed = await extractor.checkout_tab(0)
+        state = extractor.tab_count, extractor.logins
+        generation = await extractor.wait_for_session()
+        return failed, state, generation, await extractor.checkout_tab(generation)
+
+    assert asyncio.run(scenario()) == (None, (0, 1), 1, "tab1")
@@ -0,0 +1,147 @@
+from stubs import StubExtractor
+from utils.change_index import ChangeIndex
+from utils.codec import dumps, loads
+from utils.records import FlightResult
+from utils.uploader import LocalBucket, ResultUploader
+from utils.utils import date_range
+import asyncio
+
+
+def seat(points, route="QF79", date="2026-11-01"):
+    return FlightResult("MEL", "NRT", date, "J", points, route, 0, "QF")
+
+
+async def diff(index, groups, program="QF", origin="MEL", destination="NRT"):
+    """diff() then commit() of the changed dates, as a crawl does once they are stored."""
+    deltas = await index.diff(program, origin, destination, groups)
+    changed = {d: (delta["version"], groups[d]) for d, delta in deltas.items() if delta}
+    await index.commit(program, origin, destination, changed)
+    return deltas
+
+
+def test_only_changed_snapshots_come_back_as_deltas(tmp_path):
+    async def run():
+        index = ChangeIndex(tmp_path / "changes.db")
+        first = await diff(index, {"2026-11-01": [seat(60000), seat(90000, "QF81")], "2026-11-02": []})
+        # Same rows in another order
+        same = await diff(index, {"2026-11-01": [seat(90000, "QF81"), seat(60000)]})
+        changed = await diff(index, {"2026-11-01": [seat(60000), seat(75000, "QF81")]})
+        emptied = await diff(index, {"2026-11-01": []})
+        await index.close()
+        return first, same, changed, emptied
+
+    first, same, changed, emptied = asyncio.run(run())
+    assert first["2026-11-01"]["version"] == 1 and first["2026-11-01"]["previous_version"] is None
+    assert sorted(r.points for r in first["2026-11-01"]["added"]) == [60000, 90000]
+    # A date answered without seats is a snapshot too
+    assert first["2026-11-02"] == {"version": 1, "previous_version": None, "added": [], "removed": []}
+    assert same == {"2026-11-01": None}
+    assert changed["2026-11-01"]["version"] == 2 and changed["2026-11-01"]["previous_version"] == 1
+    assert changed["2026-11-01"]["added"] == [seat(75000, "QF81")]
+    assert changed["2026-11-01"]["removed"] == [seat(90000, "QF81")]
+    # Seats that disappeared are a change, not "nothing new"
+    assert emptied["2026-11-01"]["version"] == 3
+    assert sorted(r.points for r in emptied["2026-11-01"]["removed"]) == [60000, 75000]
+
+
+def test_snapshots_are_kept_per_program_and_route_across_runs(tmp_path):
+    async def run():
+        index = ChangeIndex(tmp_path / "changes.db")
+        await diff(index, {"2026-11-01": [seat(60000)]})
+        await index.close()
+
+        index = ChangeIndex(tmp_path / "changes.db")
+        again = await diff(index, {"2026-11-01": [seat(60000)]})
+        other_program = await diff(index, {"2026-11-01": [seat(60000)]}, program="VA")
+        other_route = await diff(index, {"2026-11-01": [seat(60000)]}, destination="HND")
+        await index.close()
+        return again, other_program, other_route
+
+    again, other_program, other_route = asyncio.run(run())
+    assert again == {"2026-11-01": None}
+    assert other_program["2026-11-01"]["version"] == 1
+    assert other_route["2026-11-01"]["version"] == 1
+
+
+def test_diff_alone_leaves_the_stored_snapshot(tmp_path):
+    async def run():
+        index = ChangeIndex(tmp_path / "changes.db")
+        first = await index.diff("QF", "MEL", "NRT", {"2026-11-01": [seat(60000)]})
+        again = await index.diff("QF", "MEL", "NRT", {"2026-11-01": [seat(60000)]})
+        versions = await index.versions("QF")
+        await index.close()
+        return first, again, versions
+
+    first, again, versions = asyncio.run(run())
+    assert first == again
+    assert again["2026-11-01"]["version"] == 1
+    assert versions == {}
+
+
+def test_a_crawl_uploads_full_snapshots_then_deltas(stub_server, tmp_path):
+    points = {"value": 60000}
+    server = stub_server(lambda path, body: (200, dumps({"flights": [{"route": "ST100", "points": points["value"]}]})))
+    day = next(iter(date_range(days=360, start=0, end=1)))
+
+    found = []
+
+    def crawl():
+        async def run():
+            index = ChangeIndex(tmp_path / "changes.db")
+            extractor = StubExtractor(server.url, bucket=LocalBucket(tmp_path / "bucket"), change_index=index)
+            try:
+                found.append(await extractor.crawl(["MEL"], ["NRT"], 0, 1))
+            finally:
+                await index.close()
+
+        asyncio.run(run())
+        return sorted(str(p.relative_to(tmp_path / "bucket")) for p in (tmp_path / "bucket").rglob("*.json"))
+
+    assert crawl() == [f"STUB/{day}_MEL_NRT.json"]
+    # Nothing changed: nothing new is uploaded, but the records still reach consumers
+    assert crawl() == [f"STUB/{day}_MEL_NRT.json"]
+    assert [r.points for r in found[-1]] == [60000]
+
+    points["value"] = 45000
+    assert crawl() == [f"STUB/{day}_MEL_NRT.json", f"STUB/deltas/{day}_MEL_NRT.v2.json"]
+    delta = loads((tmp_path / "bucket" / "STUB" / "deltas" / f"{day}_MEL_NRT.v2.json").read_bytes())
+    assert (delta["version"], delta["previous_version"]) == (2, 1)
+    assert [r["points"] for r in delta["added"]] == [45000]
+    assert [r["points"] for r in delta["removed"]] == [60000]
+
+
+def test_a_change_that_was_not_stored_is_uploaded_on_the_next_crawl(stub_server, tmp_path):
+    points = {"value": 60000}
+    server = stub_server(lambda path, body: (200, dumps({"flights": [{"route": "ST100", "points": points["value"]}]})))
+    day = next(iter(date_range(days=360, start=0, end=1)))
+    down = {"value": False}
+
+    class FlakyBucket(LocalBucket):
+        def blob(self, name):
+            if down["value"]:
+                raise ConnectionError("bucket unavailable")
+            return super().blob(name)
+
+    def crawl():
+        async def run():
+            index = ChangeIndex(tmp_path / "changes.db")
+            extractor = StubExtractor(server.url, bucket=FlakyBucket(tmp_path / "bucket"), change_index=index)
+            extractor.uploader = ResultUploader(extractor.bucket, max_retries=1)
+            try:
+                await extractor.crawl(["MEL"], ["NRT"], 0, 1)
+            finally:
+                await index.close()
+
+        asyncio.run(run())
+        return sorted(str(p.relative_to(tmp_path / "bucket")) for p in (tmp_path / "bucket").rglob("*.json"))
+
+    assert crawl() == [f"STUB/{day}_MEL_NRT.json"]
+    points["value"] = 45000
+    down["value"] = True
+    assert crawl() == [f"STUB/{day}_MEL_NRT.json"]
+
+    # The index still holds version 1, so the change is diffed and written again
+    down["value"] = False
+    assert crawl() == [f"STUB/{day}_MEL_NRT.json", f"STUB/deltas/{day}_MEL_NRT.v2.json"]
+    delta = loads((tmp_path / "bucket" / "STUB" / "deltas" / f"{day}_MEL_NRT.v2.json").read_bytes())
+    assert [r["points"] for r in delta["added"]] == [45000]
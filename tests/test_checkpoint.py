@@ -0,0 +1,107 @@
+from contextlib import aclosing
+from stubs import StubExtractor, search_api
+from utils.checkpoint import Checkpoint
+from utils.codec import loads
+from utils.uploader import LocalBucket, ResultUploader
+from utils.utils import date_range
+import asyncio
+
+DAYS = list(date_range(days=360, start=0, end=3))
+
+
+def searched(server) -> list:
+    return [loads(body)["date"] for path, body in server.requests]
+
+
+def test_resume_skips_done_keys_and_retries_in_flight_keys_once(tmp_path):
+    log = tmp_path / "QF.log"
+    log.write_text(
+        "S\t2026-11-01\tMEL\tNRT\n"
+        "D\t2026-11-01\tMEL\tNRT\n"
+        "S\t2026-11-02\tMEL\tNRT\n"
+        "S\t2026-11-03\tMEL\tNRT\n"
+        "S\t2026-11-03\tMEL\tNRT\n"
+        # Torn last line from the crash
+        "D\t2026-11-02\tMEL"
+    )
+    checkpoint = Checkpoint(log, resume=True)
+    checkpoint.open()
+
+    assert not checkpoint.should_run("2026-11-01", "MEL", "NRT")
+    # In flight when the process died: one more attempt
+    assert checkpoint.should_run("2026-11-02", "MEL", "NRT")
+    # The retry crashed too: given up on
+    assert not checkpoint.should_run("2026-11-03", "MEL", "NRT")
+    assert checkpoint.should_run("2026-11-04", "MEL", "NRT")
+
+    async def run():
+        await checkpoint.start("2026-11-02", "MEL", "NRT")
+        await checkpoint.close()
+
+    asyncio.run(run())
+    assert log.read_text().splitlines()[-2:] == ["D\t2026-11-02\tMEL", "S\t2026-11-02\tMEL\tNRT"]
+
+
+def test_without_resume_the_log_starts_over(tmp_path):
+    log = tmp_path / "QF.log"
+    log.write_text("S\t2026-11-01\tMEL\tNRT\nD\t2026-11-01\tMEL\tNRT\n")
+    checkpoint = Checkpoint(log)
+    checkpoint.open()
+
+    assert checkpoint.should_run("2026-11-01", "MEL", "NRT")
+    asyncio.run(checkpoint.close())
+    assert log.read_text() == ""
+
+
+def test_an_interrupted_crawl_resumes_where_it_stopped(stub_server, tmp_path):
+    server = stub_server(search_api())
+    log = tmp_path / "STUB.log"
+
+    async def interrupted():
+        extractor = StubExtractor(server.url, bucket=LocalBucket(tmp_path), checkpoint=Checkpoint(log))
+        async with aclosing(extractor.crawl_iter(["MEL"], ["NRT"], 0, 3)) as batches:
+            async for batch in batches:
+                # The first batch was handled; the process "dies" while holding the second
+                if batch[0].date == DAYS[1]:
+                    break
+
+    asyncio.run(interrupted())
+    lines = log.read_text().splitlines()
+    assert f"D\t{DAYS[0]}\tMEL\tNRT" in lines
+    assert f"D\t{DAYS[1]}\tMEL\tNRT" not in lines
+
+    server.requests.clear()
+
+    async def resumed():
+        extractor = StubExtractor(server.url, bucket=LocalBucket(tmp_path), checkpoint=Checkpoint(log, resume=True))
+        return await extractor.crawl(["MEL"], ["NRT"], 0, 3)
+
+    results = asyncio.run(resumed())
+    assert DAYS[0] not in searched(server)
+    assert sorted(searched(server)) == DAYS[1:]
+    assert {r.date for r in results} == set(DAYS[1:])
+    # A crawl that completes removes its log
+    assert not log.exists()
+
+
+def test_a_handled_batch_that_was_not_stored_stays_open(stub_server, tmp_path):
+    class DownBucket(LocalBucket):
+        def blob(self, name):
+            raise ConnectionError("bucket unavailable")
+
+    server = stub_server(search_api())
+    log = tmp_path / "STUB.log"
+
+    async def crawl():
+        extractor = StubExtractor(server.url, bucket=DownBucket(tmp_path), checkpoint=Checkpoint(log))
+        extractor.uploader = ResultUploader(extractor.bucket, max_retries=1)
+        async with aclosing(extractor.crawl_iter(["MEL"], ["NRT"], 0, 3)) as batches:
+            async for batch in batches:
+                # Every batch is handled, but the process "dies" before the crawl completes
+                if batch[0].date == DAYS[2]:
+                    break
+
+    asyncio.run(crawl())
+    lines = log.read_text().splitlines()
+    assert f"S\t{DAYS[0]}\tMEL\tNRT" in lines
+    assert not [line for line in lines if line.startswith("D")]
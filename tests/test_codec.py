@@ -0,0 +1,15 @@
+from utils.codec import DecodeError, dumps, loads
+from utils.utils import load_embedded_json
+import pytest
+
+
+@pytest.mark.parametrize("data", [b"{", b'{"a": }', b"\xff\xfe"])
+def test_malformed_input_raises_a_decode_error(data):
+    with pytest.raises(DecodeError):
+        loads(data)
+
+
+def test_embedded_json_that_does_not_parse_is_left_alone():
+    obj = {"pageBom": '{"broken": ', "requestParams": dumps({"ok": 1}).decode()}
+
+    assert load_embedded_json(obj, ["pageBom", "requestParams"]) == {"pageBom": '{"broken": ', "requestParams": {"ok": 1}}
@@ -0,0 +1,77 @@
+from pathlib import Path
+from qantas_extractor import QantasExtractor
+from utils.uploader import LocalBucket
+import asyncio
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+class FakeResponse:
+    def __init__(self, content: bytes, status_code: int = 200):
+        self.content = content
+        self.status_code = status_code
+
+
+def search(tmp_path, content, date="2026-11-02"):
+    """Run one calendar-mode search against a canned response; returns (results, answers, covered_keys)."""
+
+    async def run():
+        qantas = QantasExtractor(calendar_mode=True, bucket=LocalBucket(tmp_path))
+        qantas.search_url = "https://example.test/upsellUpdateAction"
+        qantas.search_body = "B_DATE_1=202611010000&B_LOCATION_1=SYD&E_LOCATION_1=MEL"
+
+        async def post(url, **kwargs):
+            return FakeResponse(content)
+
+        qantas.post = post
+        results = await qantas.search_flights_for_date("MEL", "NRT", date)
+        return results, qantas.answers, qantas.covered_keys
+
+    return asyncio.run(run())
+
+
+def test_calendar_page_answers_only_days_with_flights(tmp_path):
+    results, answers, covered = search(tmp_path, (FIXTURES / "qantas_ffco_calendar.json").read_bytes())
+
+    assert sorted((r.date, r.route, r.points, r.stops) for r in results) == [
+        ("2026-11-02", "QF79", 108400, 0),
+        ("2026-11-04", "QF35_SIN_JL712", 127000, 1),
+    ]
+    # The searched day plus the days flights came back for; the rest of the window is unknown
+    assert answers == {("MEL", "NRT", "2026-11-02"): ["2026-11-02", "2026-11-04"]}
+    assert covered == {("MEL", "NRT", "2026-11-02"), ("MEL", "NRT", "2026-11-04")}
+
+
+def test_other_pages_answer_nothing(tmp_path):
+    results, answers, covered = search(tmp_path, b'{"modelInput": {"pageCode": "FFSD"}}')
+
+    assert results == []
+    assert answers == {}
+    assert covered == set()
+
+
+def test_days_an_earlier_response_answered_are_left_alone(tmp_path):
+    async def run():
+        qantas = QantasExtractor(calendar_mode=True, bucket=LocalBucket(tmp_path))
+        qantas.search_url = "https://example.test/upsellUpdateAction"
+        qantas.search_body = "B_DATE_1=202611010000&B_LOCATION_1=SYD&E_LOCATION_1=MEL"
+        qantas.mark_covered("MEL", "NRT", ["2026-11-04"])
+
+        async def post(url, **kwargs):
+            return FakeResponse((FIXTURES / "qantas_ffco_calendar.json").read_bytes())
+
+        qantas.post = post
+        results = await qantas.search_flights_for_date("MEL", "NRT", "2026-11-02")
+        return results, qantas.answers
+
+    results, answers = asyncio.run(run())
+    assert [r.date for r in results] == ["2026-11-02"]
+    assert answers == {("MEL", "NRT", "2026-11-02"): ["2026-11-02"]}
+
+
+def test_calendar_mode_still_searches_every_day(tmp_path):
+    qantas = QantasExtractor(calendar_mode=True, bucket=LocalBucket(tmp_path))
+    plan = list(qantas.crawl_plan(["MEL"], ["NRT"], 0, 14))
+
+    assert len(plan) == 14
+    assert len({d for d, _, _ in plan}) == 14
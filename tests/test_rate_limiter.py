@@ -0,0 +1,86 @@
+from stubs import StubExtractor
+from utils.rate_limiter import AdaptiveLimiter, RateStore
+from utils.uploader import LocalBucket
+import asyncio
+import time
+
+
+def test_clean_responses_raise_the_rate_once_per_window():
+    limiter = AdaptiveLimiter(rate=10, window=3, increase=2)
+    limiter.feedback(200)
+    limiter.feedback(200)
+    assert limiter.rate == 10
+    limiter.feedback(200)
+    assert limiter.rate == 12
+
+
+def test_a_burst_of_failures_halves_the_rate_once_per_cooldown():
+    limiter = AdaptiveLimiter(rate=40, cooldown=60)
+    limiter.feedback(429)
+    assert limiter.rate == 20
+    limiter.feedback(503)
+    limiter.feedback(error=True)
+    assert limiter.rate == 20
+    # A failure also resets the run of clean responses
+    assert limiter.successes == 0
+
+    limiter.last_decrease -= 60
+    limiter.feedback(expired=True)
+    assert limiter.rate == 10
+
+
+def test_the_rate_stays_between_min_and_max():
+    limiter = AdaptiveLimiter(rate=8, min_rate=5, max_rate=11, window=1, increase=2)
+    limiter.backoff()
+    assert limiter.rate == 5
+    for _ in range(5):
+        limiter.feedback(200)
+    assert limiter.rate == 11
+
+
+def test_increases_pause_while_latency_runs_high():
+    limiter = AdaptiveLimiter(rate=10, window=1, increase=2)
+    limiter.feedback(200, latency=0.1)
+    assert limiter.rate == 12
+    limiter.feedback(200, latency=1.0)
+    assert limiter.rate == 12
+    # 4xx other than 403/429 is not a rate signal
+    limiter.feedback(404, latency=0.1)
+    assert limiter.rate == 12
+
+
+def test_acquire_spaces_requests_at_the_current_rate():
+    async def run():
+        limiter = AdaptiveLimiter(rate=20, time_period=1, min_rate=1)
+        start = time.monotonic()
+        for _ in range(3):
+            async with limiter:
+                pass
+        return time.monotonic() - start
+
+    # One token up front, then one every 50ms
+    assert asyncio.run(run()) >= 0.09
+
+
+def test_post_reports_responses_to_the_limiter(stub_server, tmp_path):
+    server = stub_server(lambda path, body: (503, b"{}"))
+    extractor = StubExtractor(server.url, bucket=LocalBucket(tmp_path))
+
+    async def run():
+        response = await extractor.post(f"{server.url}/search", data=b"{}")
+        assert response.status_code == 503
+
+    asyncio.run(run())
+    assert extractor.limiter.rate == 300
+
+
+def test_the_rate_store_keeps_the_last_rate_per_program(tmp_path):
+    store = RateStore(tmp_path / "rates.json")
+    assert store.load("QF", 40) == 40
+    store.save("QF", 24)
+    store.save("VA", 80)
+    assert RateStore(tmp_path / "rates.json").load("QF") == 24
+    assert store.load("VA") == 80
+
+    (tmp_path / "rates.json").write_text("{not json")
+    assert store.load("QF", 40) == 40
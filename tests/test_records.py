@@ -0,0 +1,17 @@
+from utils.records import normalize_points
+import pytest
+
+
+@pytest.mark.parametrize("value, points", [
+    (60000, 60000),
+    (60000.0, 60000),
+    ("60,000", 60000),
+    (" 60 000.0 ", 60000),
+    ("60,000 + AUD 120", None),
+    ("60000 pts", None),
+    ("", None),
+    (None, None),
+    (True, None),
+])
+def test_points_are_parsed_strictly(value, points):
+    assert normalize_points(value) == points
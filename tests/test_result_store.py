@@ -0,0 +1,106 @@
+from sqlalchemy import func, select
+from utils.records import Batch, FlightResult
+from utils.result_store import ResultStore, observations, results
+import asyncio
+
+
+def seat(date, cabin, points, program="QF", route="QF79"):
+    return FlightResult("MEL", "NRT", date, cabin, points, route, 0, program)
+
+
+def batch(*records, program="QF", answered=()):
+    """A search's batch, answering the dates it has rows for plus `answered`; every one of them changed."""
+    counts = {d: 0 for d in answered}
+    for r in records:
+        counts[r.date] = counts.get(r.date, 0) + 1
+    dates = sorted(counts)
+    return Batch(records, program, "MEL", "NRT", dates[0], counts=counts, dates=dates)
+
+
+async def observation_count(store):
+    async with (await store.connect()).connect() as conn:
+        return (await conn.execute(select(func.count()).select_from(observations))).scalar()
+
+
+def test_cheapest_filters_and_orders_current_seats(tmp_path):
+    async def run():
+        store = ResultStore(tmp_path / "results.db")
+        await store.write(batch(
+            seat("2026-03-02", "J", 90000),
+            seat("2026-03-01", "J", 60000),
+            seat("2026-03-03", "Y", 30000),
+            seat("2026-04-01", "J", 50000),
+            seat("2026-03-04", "J", None),
+        ))
+        await store.write(batch(seat("2026-03-05", "business", 60000, program="VA", route="VA5"), program="VA"))
+        try:
+            return (
+                await store.cheapest("MEL", "NRT", cabin="J", date_from="2026-03-01", date_to="2026-03-31"),
+                await store.cheapest("MEL", "NRT", program="VA"),
+                await store.cheapest("MEL", "NRT", limit=2),
+                await store.cheapest("NRT", "MEL"),
+            )
+        finally:
+            await store.close()
+
+    march_j, va, top2, reverse = asyncio.run(run())
+    # Ordered by points, then date; seats without points are never cheapest
+    assert [(r.date, r.points, r.program) for r in march_j] == [
+        ("2026-03-01", 60000, "QF"), ("2026-03-05", 60000, "VA"), ("2026-03-02", 90000, "QF"),
+    ]
+    assert va == [seat("2026-03-05", "J", 60000, program="VA", route="VA5")]
+    assert [r.points for r in top2] == [30000, 50000]
+    assert reverse == []
+
+
+def test_a_new_search_replaces_the_snapshot_and_keeps_the_history(tmp_path):
+    async def run():
+        store = ResultStore(tmp_path / "results.db")
+        await store.write(batch(seat("2026-03-01", "J", 60000), seat("2026-03-01", "F", 120000)))
+        await store.write(batch(seat("2026-03-01", "J", 75000)))
+        try:
+            return await store.cheapest("MEL", "NRT"), await observation_count(store)
+        finally:
+            await store.close()
+
+    current, history = asyncio.run(run())
+    assert current == [seat("2026-03-01", "J", 75000)]
+    assert history == 3
+
+
+def test_a_date_left_without_seats_loses_its_rows(tmp_path):
+    async def run():
+        store = ResultStore(tmp_path / "results.db")
+        await store.write(batch(seat("2026-03-01", "J", 60000), seat("2026-03-02", "J", 70000)))
+        await store.write(batch(answered=["2026-03-01"]))
+        try:
+            return await store.cheapest("MEL", "NRT"), await observation_count(store)
+        finally:
+            await store.close()
+
+    current, history = asyncio.run(run())
+    assert current == [seat("2026-03-02", "J", 70000)]
+    assert history == 2
+
+
+def test_an_unchanged_answer_refreshes_the_snapshot(tmp_path):
+    async def run():
+        store = ResultStore(tmp_path / "results.db")
+        await store.write(batch(seat("2026-03-01", "J", 60000)))
+        async with (await store.connect()).connect() as conn:
+            first = (await conn.execute(select(results.c.observed_at))).scalar()
+        again = batch(seat("2026-03-01", "J", 60000))
+        # The change index found nothing new: the batch is still written
+        again.dates = []
+        await store.write(again)
+        async with (await store.connect()).connect() as conn:
+            last = (await conn.execute(select(results.c.observed_at))).scalar()
+        try:
+            return first, last, await store.cheapest("MEL", "NRT"), await observation_count(store)
+        finally:
+            await store.close()
+
+    first, last, current, history = asyncio.run(run())
+    assert last > first
+    assert current == [seat("2026-03-01", "J", 60000)]
+    assert history == 2
@@ -0,0 +1,65 @@
+from datetime import date, timedelta
+from utils.scheduler import PriorityScheduler
+import asyncio
+import time
+
+
+class Index:
+    """Stand-in for the availability and change indexes: fixed checked times and versions per key."""
+
+    def __init__(self, checked=None, versions=None):
+        self._checked = checked or {}
+        self._versions = versions or {}
+
+    async def checked(self, program):
+        return self._checked
+
+    async def versions(self, program):
+        return self._versions
+
+
+def day(days_out: int) -> str:
+    return (date.today() + timedelta(days=days_out)).isoformat()
+
+
+def rank(scheduler, keys):
+    return asyncio.run(scheduler.rank("QF", keys))
+
+
+def test_near_stale_and_volatile_keys_come_first():
+    near, far = (day(1), "MEL", "NRT"), (day(200), "MEL", "NRT")
+    fresh, stale = (day(5), "MEL", "HKG"), (day(5), "SYD", "HKG")
+    steady, volatile = (day(30), "MEL", "LHR"), (day(30), "SYD", "LHR")
+    index = Index(
+        checked={("MEL", "HKG", day(5)): time.time()},
+        versions={("MEL", "LHR", day(30)): 1, ("SYD", "LHR", day(30)): 4},
+    )
+    scheduler = PriorityScheduler(index, index)
+
+    priority = dict(rank(scheduler, [near, far, fresh, stale, steady, volatile]))
+    assert priority[near] > priority[far]
+    # Answered moments ago: hardly worth a request
+    assert priority[fresh] < 0.01 < priority[stale]
+    assert priority[volatile] > priority[steady]
+
+
+def test_a_strict_budget_keeps_the_top_keys_in_order():
+    keys = [(day(d), "MEL", "NRT") for d in (90, 3, 40, 10, 200)]
+    scheduler = PriorityScheduler(budget=3, sample=False)
+
+    assert [key for key, priority in rank(scheduler, keys)] == [keys[1], keys[3], keys[2]]
+    assert len(rank(PriorityScheduler(budget=10, sample=False), keys)) == 5
+
+
+def test_sampling_fills_the_budget_in_proportion_to_priority():
+    near, far = (day(0), "MEL", "NRT"), (day(300), "MEL", "NRT")
+    keys = [(day(d), "MEL", "NRT") for d in range(10)]
+    scheduler = PriorityScheduler(budget=4)
+
+    ranked = rank(scheduler, keys)
+    assert len({key for key, priority in ranked}) == 4
+    assert [priority for key, priority in ranked] == sorted((priority for key, priority in ranked), reverse=True)
+
+    # near is worth ~2.6x far: it should win a one-key budget most of the time, but not always
+    picks = [rank(PriorityScheduler(budget=1), [near, far])[0][0] for _ in range(400)]
+    assert 200 < picks.count(near) < 380
@@ -0,0 +1,134 @@
+from stubs import StubExtractor, forward_proxy, search_api
+from utils.codec import loads
+from utils.session_pool import SessionPool
+from utils.uploader import LocalBucket
+from utils.utils import date_range
+import asyncio
+
+
+class Identity:
+    """Pool member stand-in whose session validates once `valid` is set."""
+
+    def __init__(self, name):
+        self.session_key = name
+        self.valid = asyncio.Event()
+        self.refreshes = 0
+
+    async def refresh_session(self):
+        self.refreshes += 1
+
+    async def validate_session(self):
+        return self.valid.is_set()
+
+
+def test_searches_go_to_the_least_loaded_member():
+    async def scenario():
+        members = [Identity("a"), Identity("b"), Identity("c")]
+        pool = SessionPool(members)
+        picked = []
+        async with pool.acquire() as first:
+            async with pool.acquire() as second:
+                picked += [first, second]
+                async with pool.acquire() as third:
+                    picked.append(third)
+            # second is free again, the others are still busy
+            async with pool.acquire() as fourth:
+                picked.append(fourth)
+        return members, picked
+
+    members, picked = asyncio.run(scenario())
+    assert picked[:3] == members
+    assert picked[3] is members[1]
+
+
+def test_a_failing_member_is_ejected_and_rejoins_once_it_validates():
+    async def scenario():
+        a, b = Identity("a"), Identity("b")
+        pool = SessionPool([a, b], max_failures=3, retry_interval=0.01)
+        for _ in range(3):
+            pool.report(b, False)
+        # Ejected: every search goes to a while b re-authenticates
+        for _ in range(5):
+            async with pool.acquire() as member:
+                assert member is a
+        await asyncio.sleep(0.05)
+        assert b.refreshes >= 2 and not pool.members[1].healthy
+        b.valid.set()
+        await asyncio.sleep(0.05)
+        healthy = [m.healthy for m in pool.members]
+        await pool.close()
+        return healthy
+
+    assert asyncio.run(scenario()) == [True, True]
+
+
+def test_a_raised_search_counts_against_its_member():
+    async def scenario():
+        a = Identity("a")
+        pool = SessionPool([a], max_failures=2, retry_interval=0.01)
+        for _ in range(2):
+            try:
+                async with pool.acquire():
+                    raise ConnectionError("proxy refused")
+            except ConnectionError:
+                pass
+        ejected = not pool.members[0].healthy
+        # With every member out, acquire() parks until one is back
+        waiter = asyncio.create_task(pool.acquire().__aenter__())
+        await asyncio.sleep(0.05)
+        parked = not waiter.done()
+        a.valid.set()
+        member = await asyncio.wait_for(waiter, 1)
+        await pool.close()
+        return ejected, parked, member is a
+
+    assert asyncio.run(scenario()) == (True, True, True)
+
+
+def test_searches_fail_over_to_the_healthy_proxy(stub_server, tmp_path):
+    api = stub_server(search_api())
+    good = stub_server(forward_proxy("good"))
+    bad = stub_server(forward_proxy("bad", down=True))
+    bucket = LocalBucket(tmp_path)
+
+    async def scenario():
+        primary = StubExtractor(api.url, proxy=good.url, workers=2, bucket=bucket)
+        member = StubExtractor(api.url, proxy=bad.url, bucket=bucket)
+        primary.add_members([member])
+        primary.pool.retry_interval = 0.01
+        results = await primary.crawl(["MEL"], ["NRT", "HKG"], 0, 10)
+        return results, primary.pool.members[1].healthy, member.logins
+
+    results, member_healthy, logins = asyncio.run(scenario())
+
+    def searched(server):
+        return {loads(body)["date"] + loads(body)["destination"] for path, body in server.requests if path.endswith("/search")}
+
+    keys = {d + t for d in date_range(days=360, start=0, end=10) for t in ("NRT", "HKG")}
+    lost = searched(bad)
+    # The bad proxy got max_failures searches (give or take one in flight) before it was ejected ...
+    assert 3 <= len(lost) <= 4
+    assert not member_healthy and logins >= 1
+    # ... and every other key went through the good one
+    assert searched(good) == searched(api) == keys - lost
+    assert {r.date + r.destination for r in results} == keys - lost
+
+
+def test_a_search_that_returns_unanswered_is_not_a_member_failure(stub_server, tmp_path):
+    api = stub_server(search_api())
+
+    class CachedExtractor(StubExtractor):
+        async def search_flights_for_date(self, origin, destination, date):
+            # A no-results cache hit: the key stays unanswered, but nothing went wrong
+            return []
+
+    async def scenario():
+        primary = CachedExtractor(api.url, workers=2, bucket=LocalBucket(tmp_path))
+        primary.add_members([CachedExtractor(api.url, bucket=LocalBucket(tmp_path))])
+        ejected = []
+        eject = primary.pool.eject
+        primary.pool.eject = lambda member: (ejected.append(member.identity.session_key), eject(member))
+        await primary.crawl(["MEL"], ["NRT", "HKG"], 0, 10)
+        return ejected
+
+    assert asyncio.run(scenario()) == []
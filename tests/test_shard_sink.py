@@ -0,0 +1,116 @@
+from utils.codec import loads
+from utils.records import Batch, FlightResult
+from utils.shard_sink import ShardSink, decode_member, encode_shard
+from utils.uploader import LocalBucket, ResultUploader
+import asyncio
+import gzip
+
+
+def record(origin, destination, date, points=60000, program="QF"):
+    return FlightResult(origin, destination, date, "J", points, "QF1", 0, program)
+
+
+def batch(records, date, origin="MEL", destination="NRT", deltas=None):
+    return Batch(records, program="QF", origin=origin, destination=destination, date=date,
+                 counts={date: len(records)}, dates=[date], deltas=deltas)
+
+
+def test_every_route_and_month_is_its_own_gzip_member():
+    records = [
+        record("MEL", "NRT", "2026-11-30"),
+        record("SYD", "HKG", "2026-11-02"),
+        record("MEL", "NRT", "2026-12-01"),
+        record("MEL", "NRT", "2026-11-02"),
+    ]
+    data, members = encode_shard(records)
+
+    assert [(m["origin"], m["destination"], m["month"], m["rows"]) for m in members] == [
+        ("MEL", "NRT", "2026-11", 2),
+        ("MEL", "NRT", "2026-12", 1),
+        ("SYD", "HKG", "2026-11", 1),
+    ]
+    first = members[0]
+    assert (first["date_min"], first["date_max"]) == ("2026-11-02", "2026-11-30")
+    # A range read of one member decodes on its own ...
+    ranged = decode_member(data[first["offset"]:first["offset"] + first["length"]])
+    assert ranged == [records[3], records[0]]
+    # ... and the whole shard is still one valid .gz file
+    assert sorted(decode_member(data), key=lambda r: r.as_tuple()) == sorted(records, key=lambda r: r.as_tuple())
+
+
+def test_sink_writes_shards_deltas_and_manifest(tmp_path):
+    removed = record("MEL", "NRT", "2026-11-03", points=45000)
+    delta = {"version": 2, "previous_version": 1, "added": [], "removed": [removed]}
+    run_dir = tmp_path / "QF" / "runs" / "run1"
+
+    async def run():
+        uploader = ResultUploader(LocalBucket(tmp_path))
+        sink = ShardSink(uploader, "QF", "run1", shard_rows=3)
+        stored = [
+            await sink.write(batch([record("MEL", "NRT", "2026-11-01"), record("MEL", "NRT", "2026-11-01", 80000)], "2026-11-01")),
+            await sink.write(batch([record("MEL", "NRT", "2026-11-02")], "2026-11-02")),
+            # A date that lost its only seat: no rows, just the delta
+            await sink.write(batch([], "2026-11-03", deltas={"2026-11-03": delta})),
+        ]
+        # The first shard filled up and was stored; the last batch waits for the next one
+        assert stored[0] is stored[1] and stored[0].result() is True
+        assert not stored[2].done()
+        # A crash now would still leave a manifest listing the stored shard
+        partial = loads((run_dir / "manifest.json").read_bytes())
+        assert (partial["complete"], partial["rows"]) == (False, 3)
+        await sink.close()
+        assert stored[2].result() is True
+        await uploader.close()
+
+    asyncio.run(run())
+    manifest = loads((run_dir / "manifest.json").read_bytes())
+    assert manifest["complete"] is True
+    assert manifest["rows"] == 3
+    assert [s["name"] for s in manifest["shards"]] == ["QF/runs/run1/part-00000.ndjson.gz"]
+    assert [d["name"] for d in manifest["deltas"]] == ["QF/runs/run1/deltas-00000.ndjson.gz"]
+
+    shard = (tmp_path / manifest["shards"][0]["name"]).read_bytes()
+    member = manifest["shards"][0]["members"][0]
+    assert len(decode_member(shard[member["offset"]:member["offset"] + member["length"]])) == 3
+
+    lines = [loads(line) for line in gzip.decompress((tmp_path / manifest["deltas"][0]["name"]).read_bytes()).splitlines()]
+    assert lines == [{
+        "program": "QF", "origin": "MEL", "destination": "NRT", "date": "2026-11-03",
+        "version": 2, "previous_version": 1, "added": [], "removed": [removed.to_dict()],
+    }]
+
+
+def test_a_shard_that_was_not_stored_is_not_listed(tmp_path):
+    class DownBucket(LocalBucket):
+        def blob(self, name):
+            raise ConnectionError("bucket unavailable")
+
+    async def run():
+        uploader = ResultUploader(DownBucket(tmp_path), max_retries=1)
+        sink = ShardSink(uploader, "QF", "run1")
+        stored = await sink.write(batch([record("MEL", "NRT", "2026-11-01")], "2026-11-01"))
+        await sink.flush_shard()
+        await uploader.close()
+        return stored.result(), sink.shards
+
+    assert asyncio.run(run()) == (False, [])
+
+
+def test_only_rows_of_changed_dates_go_into_shards(tmp_path):
+    async def run():
+        uploader = ResultUploader(LocalBucket(tmp_path))
+        sink = ShardSink(uploader, "QF", "run1")
+        # One response answered two dates, only the second one changed
+        mixed = Batch(
+            [record("MEL", "NRT", "2026-11-01"), record("MEL", "NRT", "2026-11-02")], program="QF",
+            origin="MEL", destination="NRT", date="2026-11-01",
+            counts={"2026-11-01": 1, "2026-11-02": 1}, dates=["2026-11-02"],
+        )
+        await sink.write(mixed)
+        await sink.close()
+        await uploader.close()
+        return sink.shards
+
+    shards = asyncio.run(run())
+    shard = (tmp_path / shards[0]["name"]).read_bytes()
+    assert [r.date for r in decode_member(shard)] == ["2026-11-02"]
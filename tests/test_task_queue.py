@@ -0,0 +1,187 @@
+from stubs import StubExtractor, search_api
+from utils.codec import loads
+from utils.scheduler import PriorityScheduler
+from utils.task_queue import TaskQueue
+from utils.uploader import LocalBucket
+import asyncio
+import time
+
+KEYS = [("2026-11-01", "MEL", "NRT"), ("2026-11-02", "MEL", "NRT"), ("2026-11-03", "MEL", "NRT")]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_each_key_is_leased_to_one_owner(tmp_path):
+    async def scenario():
+        # Two nodes on the same queue file, each with its own connection
+        a = TaskQueue(tmp_path / "tasks.db", run="r1")
+        b = TaskQueue(tmp_path / "tasks.db", run="r1")
+        assert await a.enqueue("QF", KEYS) == 3
+        # Enqueueing the same run again adds nothing
+        assert await b.enqueue("QF", KEYS) == 0
+
+        async def drain(queue, owner):
+            leased = []
+            while (key := await queue.lease("QF", owner)) is not None:
+                leased.append(key)
+            return leased
+
+        leased = await asyncio.gather(drain(a, "a"), drain(b, "b"), drain(a, "a2"), drain(b, "b2"))
+        counts = await a.counts("QF")
+        await a.close()
+        await b.close()
+        return leased, counts
+
+    leased, counts = run(scenario())
+    flat = [key for keys in leased for key in keys]
+    assert sorted(flat) == KEYS
+    assert counts == {"leased": 3}
+
+
+def test_keys_lease_highest_priority_first(tmp_path):
+    async def scenario():
+        queue = TaskQueue(tmp_path / "tasks.db")
+        await queue.enqueue("QF", KEYS, {KEYS[2]: 5.0, KEYS[0]: 1.0})
+        order = [await queue.lease("QF", "a") for _ in KEYS]
+        await queue.close()
+        return order
+
+    assert run(scenario()) == [KEYS[2], KEYS[0], KEYS[1]]
+
+
+def test_an_expired_lease_is_requeued_until_max_attempts(tmp_path):
+    async def scenario():
+        queue = TaskQueue(tmp_path / "tasks.db", lease_ttl=0.05, max_attempts=2)
+        await queue.enqueue("QF", KEYS[:1])
+        first = await queue.lease("QF", "dead-node")
+        # Live lease: nobody else gets the key
+        assert await queue.lease("QF", "b") is None
+        assert await queue.has_open("QF", "b")
+        await asyncio.sleep(0.1)
+        second = await queue.lease("QF", "b")
+        await asyncio.sleep(0.1)
+        # Second attempt expired too: the key is given up on
+        third = await queue.lease("QF", "c")
+        is_open = await queue.has_open("QF", "c")
+        await queue.close()
+        return first, second, third, is_open
+
+    first, second, third, is_open = run(scenario())
+    assert first == second == KEYS[0]
+    assert third is None
+    assert not is_open
+
+
+def test_heartbeat_keeps_a_lease_alive(tmp_path):
+    async def scenario():
+        queue = TaskQueue(tmp_path / "tasks.db", lease_ttl=0.2)
+        await queue.enqueue("QF", KEYS[:1])
+        await queue.lease("QF", "a")
+        deadline = time.monotonic() + 0.4
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            await queue.heartbeat("a")
+            assert await queue.lease("QF", "b") is None
+        await queue.close()
+
+    run(scenario())
+
+
+def test_released_keys_go_back_to_the_pool(tmp_path):
+    async def scenario():
+        queue = TaskQueue(tmp_path / "tasks.db", max_attempts=2)
+        await queue.enqueue("QF", KEYS[:2])
+        key = await queue.lease("QF", "a")
+        other = await queue.lease("QF", "a")
+        await queue.complete("QF", *other)
+        # A release by someone else's name changes nothing
+        await queue.release("QF", "b", *key)
+        assert await queue.lease("QF", "b") is None
+        await queue.release("QF", "a", *key)
+        assert await queue.lease("QF", "b") == key
+        await queue.release("QF", "b", *key)
+        # Out of attempts: failed, and nothing is left open
+        counts = await queue.counts("QF")
+        is_open = await queue.has_open("QF")
+        await queue.close()
+        return counts, is_open
+
+    counts, is_open = run(scenario())
+    assert counts == {"done": 1, "failed": 1}
+    assert not is_open
+
+
+def test_own_live_leases_do_not_keep_the_owner_polling(tmp_path):
+    async def scenario():
+        queue = TaskQueue(tmp_path / "tasks.db")
+        await queue.enqueue("QF", KEYS[:1])
+        await queue.lease("QF", "a")
+        result = await queue.has_open("QF", "a"), await queue.has_open("QF", "b")
+        await queue.close()
+        return result
+
+    assert run(scenario()) == (False, True)
+
+
+def test_a_limit_caps_the_keys_of_a_run(tmp_path):
+    async def scenario():
+        a = TaskQueue(tmp_path / "tasks.db", run="r1")
+        b = TaskQueue(tmp_path / "tasks.db", run="r1")
+        added = [await a.enqueue("QF", KEYS[:2], limit=2), await b.enqueue("QF", KEYS[2:], limit=2)]
+        # Other programs and runs have their own room
+        added.append(await b.enqueue("VA", KEYS, limit=2))
+        counts = await a.counts("QF")
+        await a.close()
+        await b.close()
+        return added, counts
+
+    added, counts = run(scenario())
+    assert added == [2, 0, 2]
+    assert counts == {"pending": 2}
+
+
+def test_nodes_enqueueing_their_own_samples_stay_within_the_budget(stub_server, tmp_path):
+    server = stub_server(search_api())
+
+    async def node():
+        queue = TaskQueue(tmp_path / "tasks.db", run="r1")
+        extractor = StubExtractor(server.url, bucket=LocalBucket(tmp_path / "bucket"), scheduler=PriorityScheduler(budget=5))
+        added = await extractor.enqueue_tasks(queue, ["MEL", "SYD"], ["NRT", "HKG"], 0, 10)
+        await queue.close()
+        return added
+
+    async def scenario():
+        added = [await node() for _ in range(3)]
+        queue = TaskQueue(tmp_path / "tasks.db", run="r1")
+        counts = await queue.counts("STUB")
+        await queue.close()
+        return added, counts
+
+    added, counts = run(scenario())
+    assert added == [5, 0, 0]
+    assert counts == {"pending": 5}
+
+def test_nodes_split_a_crawl_without_fetching_a_key_twice(stub_server, tmp_path):
+    server = stub_server(search_api(), delay=0.01)
+
+    async def node(name):
+        queue = TaskQueue(tmp_path / "tasks.db", run="r1")
+        extractor = StubExtractor(server.url, workers=2, bucket=LocalBucket(tmp_path / "bucket"))
+        await extractor.enqueue_tasks(queue, ["MEL", "SYD"], ["NRT", "HKG"], 0, 5)
+        results = []
+        async for batch in extractor.crawl_leased(queue, name, poll_interval=0.01):
+            results.extend(batch)
+        counts = await queue.counts(extractor.program)
+        await queue.close()
+        return results, counts
+
+    async def scenario():
+        return await asyncio.gather(node("a"), node("b"))
+
+    (a, counts), (b, _) = run(scenario())
+    searched = [loads(body) for path, body in server.requests if path == "/search"]
+    assert len(searched) == len({tuple(q.values()) for q in searched}) == 20
+    assert len(a) + len(b) == 20
+    assert counts == {"done": 20}
@@ -0,0 +1,98 @@
+from utils.metrics import Metrics
+from utils.uploader import LocalBlob, LocalBucket, ResultUploader
+import asyncio
+import threading
+import time
+
+
+class FlakyBucket(LocalBucket):
+    """LocalBucket whose uploads fail `failures` times per blob before they go through."""
+
+    def __init__(self, root, failures: int):
+        super().__init__(root)
+        self.failures = failures
+        self.attempts = {}
+        self.lock = threading.Lock()
+
+    def blob(self, name: str):
+        bucket = self
+
+        class FlakyBlob(LocalBlob):
+            def upload_from_string(self, data, content_type=None):
+                with bucket.lock:
+                    bucket.attempts[name] = bucket.attempts.get(name, 0) + 1
+                    attempt = bucket.attempts[name]
+                if attempt <= bucket.failures:
+                    raise ConnectionError("bucket unavailable")
+                super().upload_from_string(data, content_type)
+
+        return FlakyBlob(self.root / name)
+
+
+class SlowBucket(LocalBucket):
+    def blob(self, name: str):
+        class SlowBlob(LocalBlob):
+            def upload_from_string(self, data, content_type=None):
+                time.sleep(0.05)
+                super().upload_from_string(data, content_type)
+
+        return SlowBlob(self.root / name)
+
+
+def test_flush_waits_for_every_queued_upload(tmp_path):
+    async def run():
+        uploader = ResultUploader(LocalBucket(tmp_path), threads=4)
+        uploads = [await uploader.put(f"P/{i}.json", f'{{"i": {i}}}'.encode()) for i in range(20)]
+        await uploader.flush()
+        assert all(upload.done() and upload.result() for upload in uploads)
+        await uploader.close()
+
+    asyncio.run(run())
+    assert sorted(p.name for p in (tmp_path / "P").iterdir()) == sorted(f"{i}.json" for i in range(20))
+    assert (tmp_path / "P" / "7.json").read_bytes() == b'{"i": 7}'
+
+
+def test_failed_uploads_are_retried(tmp_path):
+    bucket = FlakyBucket(tmp_path, failures=2)
+    metrics = Metrics()
+
+    async def run():
+        uploader = ResultUploader(bucket, max_retries=3, retry_backoff=0.01, metrics=metrics)
+        upload = await uploader.put("P/a.json", b"[]")
+        assert await upload is True
+        await uploader.close()
+
+    asyncio.run(run())
+    assert bucket.attempts["P/a.json"] == 3
+    assert (tmp_path / "P" / "a.json").read_bytes() == b"[]"
+    assert metrics.counter("uploads_total", outcome="ok") == 1
+
+
+def test_an_upload_is_given_up_on_after_max_retries(tmp_path):
+    bucket = FlakyBucket(tmp_path, failures=10)
+    metrics = Metrics()
+
+    async def run():
+        uploader = ResultUploader(bucket, max_retries=3, retry_backoff=0.01, metrics=metrics)
+        upload = await uploader.put("P/a.json", b"[]")
+        assert await upload is False
+        await uploader.close()
+
+    asyncio.run(run())
+    assert bucket.attempts["P/a.json"] == 3
+    assert not (tmp_path / "P" / "a.json").exists()
+    assert metrics.counter("uploads_total", outcome="failed") == 1
+
+
+def test_a_full_queue_pushes_back_and_close_drains_it(tmp_path):
+    async def run():
+        uploader = ResultUploader(SlowBucket(tmp_path), threads=1, max_queue=2)
+        start = time.monotonic()
+        for i in range(6):
+            await uploader.put(f"P/{i}.json", b"{}")
+        # Only max_queue uploads wait in the queue, so the producer had to wait for the bucket
+        assert time.monotonic() - start >= 0.1
+        await uploader.close()
+
+    asyncio.run(run())
+    assert len(list((tmp_path / "P").iterdir())) == 6
@@ -0,0 +1,49 @@
+from utils.uploader import LocalBucket
+from virgin_extractor import VirginExtractor
+import asyncio
+import pytest
+
+
+class FakeResponse:
+    def __init__(self, content: bytes, status_code: int = 200):
+        self.content = content
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+def virgin(tmp_path, *responses):
+    """A VirginExtractor answering its requests with `responses` in turn, without logging in."""
+    extractor = VirginExtractor(bucket=LocalBucket(tmp_path))
+    replies = iter(responses)
+
+    async def post(url, **kwargs):
+        return next(replies)
+
+    async def refresh_session(generation=None):
+        pass
+
+    extractor.post = post
+    extractor.refresh_session = refresh_session
+    return extractor
+
+
+def test_an_empty_offer_list_answers_the_date(tmp_path):
+    extractor = virgin(tmp_path, FakeResponse(b'{"data": {"bookingAirSearch": {"originalResponse": {"unbundledOffers": []}}}}'))
+
+    results = asyncio.run(extractor.search_flights_for_date("MEL", "SYD", "2026-11-02"))
+    assert results == []
+    assert extractor.answers == {("MEL", "SYD", "2026-11-02"): ["2026-11-02"]}
+    for stage in ("decode", "resolve_refs", "extract_offers"):
+        assert extractor.metrics.histogram("parse_seconds", stage=stage).count == 1
+
+
+def test_an_error_after_the_refresh_answers_nothing(tmp_path):
+    error = FakeResponse(b'{"errors": [{"message": "Forbidden"}]}', 403)
+    extractor = virgin(tmp_path, error, error)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(extractor.search_flights_for_date("MEL", "SYD", "2026-11-02"))
+    assert extractor.answers == {}
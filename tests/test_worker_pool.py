@@ -0,0 +1,48 @@
+from stubs import StubExtractor, search_api
+from utils.uploader import LocalBucket
+from utils.utils import date_range
+import asyncio
+
+ORIGINS = ["MEL", "SYD"]
+DESTINATIONS = ["NRT", "HKG", "LHR"]
+
+
+def crawl(extractor, start_day=0, end_day=4):
+    return asyncio.run(extractor.crawl(ORIGINS, DESTINATIONS, start_day, end_day))
+
+
+def test_workers_fan_out_up_to_the_bound(stub_server, tmp_path):
+    server = stub_server(search_api(), delay=0.05)
+    extractor = StubExtractor(server.url, workers=4, bucket=LocalBucket(tmp_path))
+
+    results = crawl(extractor)
+
+    keys = {(d, o, t) for d in date_range(days=360, start=0, end=4) for o in ORIGINS for t in DESTINATIONS}
+    assert {(r.date, r.origin, r.destination) for r in results} == keys
+    # Every key fetched exactly once, at most `workers` at a time
+    assert len(server.requests) == len(keys)
+    assert 1 < server.max_in_flight <= 4
+    # The per-key blobs still land in the bucket
+    assert len(list((tmp_path / "STUB").glob("*.json"))) == len(keys)
+
+
+def test_a_failing_key_does_not_stop_the_others(stub_server, tmp_path):
+    days = list(date_range(days=360, start=0, end=3))
+    server = stub_server(search_api(fail_dates={days[1]}))
+    extractor = StubExtractor(server.url, workers=3, bucket=LocalBucket(tmp_path))
+
+    results = crawl(extractor, end_day=3)
+
+    assert {r.date for r in results} == {days[0], days[2]}
+    assert len(results) == 2 * len(ORIGINS) * len(DESTINATIONS)
+    assert not (tmp_path / "STUB" / f"{days[1]}_MEL_NRT.json").exists()
+
+
+def test_request_bodies_are_counted_as_sent(tmp_path):
+    extractor = StubExtractor("http://stub.test", bucket=LocalBucket(tmp_path))
+    # A form dict is sent urlencoded, a json argument as JSON
+    extractor.log_request("POST", "http://stub.test/search", {"B_LOCATION_1": "MEL", "E_LOCATION_1": "NRT"})
+    extractor.log_request("POST", "http://stub.test/search", None, {"origin": "MEL"})
+
+    assert extractor.metrics.counter("requests_sent_total", method="POST") == 2
+    assert extractor.metrics.counter("bytes_out_total") == len("B_LOCATION_1=MEL&E_LOCATION_1=NRT") + len(b'{"origin":"MEL"}')
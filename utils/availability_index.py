@@ -0,0 +1,90 @@
+from pathlib import Path
+import aiosqlite
+import asyncio
+import time
+
+
+class AvailabilityIndex:
+    """
+    Persistent (program, origin, destination, date) index of when a key was last answered,
+    how many results it had and when availability was last seen on it.
+    A key counts as fresh while its last answer is younger than empty_ttl (no availability)
+    or seen_ttl (availability present, which changes faster), and fresh keys are skipped by the crawl.
+    One connection is shared by every extractor and worker; WAL lets other processes read alongside.
+    """
+
+    def __init__(self, path: str = "db/availability.db", empty_ttl: float = 24 * 3600, seen_ttl: float = 6 * 3600):
+        self.path = Path(path)
+        self.empty_ttl = empty_ttl
+        self.seen_ttl = seen_ttl
+        self.db = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self.lock:
+            if self.db is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self.db = await aiosqlite.connect(self.path)
+                await self.db.execute("PRAGMA journal_mode=WAL")
+                await self.db.execute("""
+                    CREATE TABLE IF NOT EXISTS availability (
+                        program TEXT NOT NULL,
+                        origin TEXT NOT NULL,
+                        destination TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        checked_at REAL NOT NULL,
+                        seen_at REAL,
+                        results INTEGER NOT NULL,
+                        PRIMARY KEY (program, origin, destination, date)
+                    )
+                """)
+                await self.db.commit()
+        return self.db
+
+    async def close(self):
+        if self.db is not None:
+            await self.db.close()
+            self.db = None
+
+    async def record(self, program: str, origin: str, destination: str, counts: dict):
+        """Store {date: result_count} for one route as answered now."""
+        db = await self.connect()
+        now = time.time()
+        await db.executemany(
+            """
+            INSERT INTO availability (program, origin, destination, date, checked_at, seen_at, results)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (program, origin, destination, date) DO UPDATE SET
+                checked_at = excluded.checked_at,
+                results = excluded.results,
+                seen_at = COALESCE(excluded.seen_at, availability.seen_at)
+            """,
+            [
+                (program, origin, destination, date, now, now if count else None, count)
+                for date, count in counts.items()
+            ],
+        )
+        await db.commit()
+
+    async def fresh_keys(self, program: str) -> set:
+        """(origin, destination, date) keys of a program whose last answer has not expired yet."""
+        db = await self.connect()
+        now = time.time()
+        async with db.execute(
+            """
+            SELECT origin, destination, date FROM availability
+            WHERE program = ?
+              AND ((results = 0 AND checked_at > ?) OR (results > 0 AND checked_at > ?))
+            """,
+            (program, now - self.empty_ttl, now - self.seen_ttl),
+        ) as cursor:
+            return {tuple(row) for row in await cursor.fetchall()}
+
+    async def checked(self, program: str) -> dict:
+        """(origin, destination, date) -> when it was last answered, for every key of a program."""
+        db = await self.connect()
+        async with db.execute(
+            "SELECT origin, destination, date, checked_at FROM availability WHERE program = ?",
+            (program,),
+        ) as cursor:
+            return {tuple(row[:3]): row[3] for row in await cursor.fetchall()}
@@ -0,0 +1,62 @@
+from camoufox.async_api import AsyncCamoufox
+from contextlib import asynccontextmanager
+from rich import print
+from urllib.parse import urlsplit
+import asyncio
+
+
+def playwright_proxy(url: str) -> dict:
+    """Playwright's proxy settings for a proxy URL; credentials go in their own fields."""
+    parts = urlsplit(url)
+    proxy = {"server": f"{parts.scheme or 'http'}://{parts.hostname}" + (f":{parts.port}" if parts.port else "")}
+    if parts.username:
+        proxy["username"] = parts.username
+        proxy["password"] = parts.password or ""
+    return proxy
+
+
+class BrowserManager:
+    """
+    Keeps one warm Camoufox process for the whole run. Every login gets its own
+    browser context, so cookies and storage stay isolated per program while the
+    launch cost is paid once and re-authentication mid-crawl starts instantly.
+    """
+
+    def __init__(self, headless="virtual", **launch_options):
+        # Union of what the extractors need: main_world_eval for Cathay's requestParams,
+        # humanize/geoip for Qantas
+        self.launch_options = {"headless": headless, "main_world_eval": True, "humanize": True, "geoip": True}
+        self.launch_options.update(launch_options)
+        self.camoufox = None
+        self.browser = None
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        async with self.lock:
+            if self.browser is None:
+                print("Launching shared browser")
+                self.camoufox = AsyncCamoufox(**self.launch_options)
+                self.browser = await self.camoufox.__aenter__()
+        return self.browser
+
+    async def close(self):
+        async with self.lock:
+            if self.camoufox is not None:
+                await self.camoufox.__aexit__(None, None, None)
+            self.camoufox = None
+            self.browser = None
+
+    @asynccontextmanager
+    async def page(self, proxy: str = None):
+        """A fresh page in a fresh context; the context is closed when the block exits."""
+        browser = await self.start()
+        if not browser.is_connected():
+            # The process died (crash or OOM), relaunch before handing out a context
+            await self.close()
+            browser = await self.start()
+        # A pooled identity logs in through its own proxy, so cookies match the IP that uses them
+        context = await browser.new_context(proxy=playwright_proxy(proxy)) if proxy else await browser.new_context()
+        try:
+            yield await context.new_page()
+        finally:
+            await context.close()
@@ -0,0 +1,50 @@
+from pathlib import Path
+from utils.codec import dumps
+from utils.utils import read_json, write_atomic
+import time
+
+
+class TTLCache:
+    """
+    Small key -> value cache where every entry expires ttl seconds after it was set.
+    When a path is given the live entries are loaded on start and written back by save(),
+    so lookups survive process restarts.
+    """
+
+    def __init__(self, ttl: float, path: str = None):
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self.entries = {}
+        self.load()
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at < time.time():
+            del self.entries[key]
+            return default
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = (value, time.time() + self.ttl)
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def load(self):
+        if not self.path:
+            return
+        stored = read_json(self.path)
+        if stored is None:
+            return
+        now = time.time()
+        self.entries = {k: tuple(v) for k, v in stored.items() if v[1] >= now}
+
+    def save(self):
+        if not self.path:
+            return
+        now = time.time()
+        live = {k: v for k, v in self.entries.items() if v[1] >= now}
+        write_atomic(self.path, dumps(live))
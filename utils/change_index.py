@@ -0,0 +1,123 @@
+from pathlib import Path
+from utils.codec import dumps, loads
+from utils.records import FlightResult
+import aiosqlite
+import asyncio
+import hashlib
+import time
+
+
+class ChangeIndex:
+    """
+    Persistent content hash and last snapshot per (program, origin, destination, date).
+    diff() compares a fresh answer with the stored snapshot: unchanged keys come back as None
+    so their writes can be skipped, changed keys as a delta (added/removed rows, new version)
+    that commit() makes the stored snapshot once it has been written out.
+    """
+
+    def __init__(self, path: str = "db/changes.db"):
+        self.path = Path(path)
+        self.db = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self.lock:
+            if self.db is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self.db = await aiosqlite.connect(self.path)
+                await self.db.execute("PRAGMA journal_mode=WAL")
+                await self.db.execute("""
+                    CREATE TABLE IF NOT EXISTS snapshots (
+                        program TEXT NOT NULL,
+                        origin TEXT NOT NULL,
+                        destination TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        hash TEXT NOT NULL,
+                        version INTEGER NOT NULL,
+                        rows BLOB NOT NULL,
+                        changed_at REAL NOT NULL,
+                        PRIMARY KEY (program, origin, destination, date)
+                    )
+                """)
+                await self.db.commit()
+        return self.db
+
+    async def close(self):
+        if self.db is not None:
+            await self.db.close()
+            self.db = None
+
+    @staticmethod
+    def encode(records) -> tuple:
+        """Canonical bytes of a snapshot (row order does not matter) and their hash."""
+        rows = sorted(dumps(r.as_tuple()) for r in records)
+        encoded = b"[" + b",".join(rows) + b"]"
+        return encoded, hashlib.sha1(encoded).hexdigest()
+
+    async def diff(self, program: str, origin: str, destination: str, groups: dict) -> dict:
+        """
+        groups maps each answered date to its records (possibly empty). Returns {date: None} for
+        unchanged snapshots and {date: {"version", "previous_version", "added", "removed"}} for
+        changed ones. Nothing is written: commit() advances the index once the new snapshots
+        are stored, so a snapshot that never made it is diffed against the old one again.
+        """
+        db = await self.connect()
+        dates = list(groups)
+        async with db.execute(
+            f"""
+            SELECT date, hash, version, rows FROM snapshots
+            WHERE program = ? AND origin = ? AND destination = ? AND date IN ({", ".join("?" * len(dates))})
+            """,
+            (program, origin, destination, *dates),
+        ) as cursor:
+            previous = {row[0]: row[1:] for row in await cursor.fetchall()}
+
+        deltas = {}
+        for date, records in groups.items():
+            _, digest = self.encode(records)
+            old = previous.get(date)
+            if old and old[0] == digest:
+                deltas[date] = None
+                continue
+            old_rows = {tuple(t) for t in loads(old[2])} if old else set()
+            new_rows = {r.as_tuple() for r in records}
+            deltas[date] = {
+                "version": old[1] + 1 if old else 1,
+                "previous_version": old[1] if old else None,
+                "added": [FlightResult(*t) for t in new_rows - old_rows],
+                "removed": [FlightResult(*t) for t in old_rows - new_rows],
+            }
+        return deltas
+
+    async def commit(self, program: str, origin: str, destination: str, snapshots: dict):
+        """snapshots maps changed dates to (version, records) as diff() found them; they replace the stored ones."""
+        if not snapshots:
+            return
+        db = await self.connect()
+        now = time.time()
+        upserts = []
+        for date, (version, records) in snapshots.items():
+            encoded, digest = self.encode(records)
+            upserts.append((program, origin, destination, date, digest, version, encoded, now))
+        await db.executemany(
+            """
+            INSERT INTO snapshots (program, origin, destination, date, hash, version, rows, changed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (program, origin, destination, date) DO UPDATE SET
+                hash = excluded.hash,
+                version = excluded.version,
+                rows = excluded.rows,
+                changed_at = excluded.changed_at
+            """,
+            upserts,
+        )
+        await db.commit()
+
+    async def versions(self, program: str) -> dict:
+        """(origin, destination, date) -> snapshot version, i.e. how many distinct answers the key has had."""
+        db = await self.connect()
+        async with db.execute(
+            "SELECT origin, destination, date, version FROM snapshots WHERE program = ?",
+            (program,),
+        ) as cursor:
+            return {tuple(row[:3]): row[3] for row in await cursor.fetchall()}
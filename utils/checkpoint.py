@@ -0,0 +1,89 @@
+from pathlib import Path
+from rich import print
+import asyncio
+import os
+import time
+
+
+class Checkpoint:
+    """
+    Append-only progress log for one program's crawl: an "S" line when a (date, origin, destination)
+    key starts and a "D" line when it finishes, fsynced in batches (every sync_every lines or
+    sync_interval seconds) to keep the overhead low.
+
+    With resume=True the existing log is replayed: finished keys are skipped, keys that were in
+    flight when the process died get exactly one more attempt, and keys that were already retried
+    once are given up on. A crawl that completes removes its log, so the next run starts clean.
+    """
+
+    def __init__(self, path: str, resume: bool = False, sync_every: int = 50, sync_interval: float = 5.0):
+        self.path = Path(path)
+        self.resume = resume
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.done_keys = set()
+        self.starts = {}
+        self.file = None
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.resume and self.path.exists():
+            with open(self.path) as f:
+                lines = f.readlines()
+            for line in lines:
+                parts = line.rstrip("\n").split("\t")
+                if not line.endswith("\n") or len(parts) != 4:
+                    # Torn last line from the crash
+                    continue
+                kind, key = parts[0], tuple(parts[1:])
+                if kind == "S":
+                    self.starts[key] = self.starts.get(key, 0) + 1
+                elif kind == "D":
+                    self.done_keys.add(key)
+            in_flight = sum(1 for key in self.starts if key not in self.done_keys)
+            print(f"Resuming from {self.path}: {len(self.done_keys)} keys done, {in_flight} were in flight")
+            self.file = open(self.path, "a")
+            if lines and not lines[-1].endswith("\n"):
+                self.file.write("\n")
+        else:
+            self.file = open(self.path, "w")
+
+    def should_run(self, date: str, origin: str, destination: str) -> bool:
+        key = (date, origin, destination)
+        if key in self.done_keys:
+            return False
+        # Started twice without finishing: the retry crashed too, don't try a third time
+        return self.starts.get(key, 0) < 2
+
+    async def start(self, date: str, origin: str, destination: str):
+        await self._append("S", date, origin, destination)
+
+    async def done(self, date: str, origin: str, destination: str):
+        await self._append("D", date, origin, destination)
+
+    async def _append(self, kind: str, date: str, origin: str, destination: str):
+        if self.file is None:
+            self.open()
+        self.file.write(f"{kind}\t{date}\t{origin}\t{destination}\n")
+        self.pending += 1
+        if self.pending >= self.sync_every or time.monotonic() - self.last_sync >= self.sync_interval:
+            await self.sync()
+
+    async def sync(self):
+        if self.file is None or not self.pending:
+            return
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.file.flush()
+        await asyncio.to_thread(os.fsync, self.file.fileno())
+
+    async def close(self, completed: bool = False):
+        if self.file is None:
+            return
+        await self.sync()
+        self.file.close()
+        self.file = None
+        if completed:
+            self.path.unlink(missing_ok=True)
@@ -0,0 +1,62 @@
+"""
+JSON codec used across the crawler: orjson when installed, then msgspec, then the standard library.
+loads() takes response bytes directly (no intermediate str) and dumps() always returns bytes.
+DecodeError is the tuple of exceptions the active backend raises on malformed input.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _default(obj):
+    # Records such as FlightResult serialize through their own to_dict()
+    to_dict = getattr(obj, "to_dict", None)
+    if to_dict is not None:
+        return to_dict()
+    return str(obj)
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    # orjson.JSONDecodeError is a ValueError
+    DecodeError = (ValueError,)
+
+elif msgspec is not None:
+    BACKEND = "msgspec"
+    _decoder = msgspec.json.Decoder()
+    _encoder = msgspec.json.Encoder(enc_hook=_default)
+
+    def loads(data):
+        return _decoder.decode(data)
+
+    def dumps(obj) -> bytes:
+        return _encoder.encode(obj)
+
+    # msgspec.DecodeError is not a ValueError; UnicodeDecodeError and friends still are
+    DecodeError = (ValueError, msgspec.DecodeError)
+
+else:
+    BACKEND = "json"
+
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+    DecodeError = (ValueError,)
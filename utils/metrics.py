@@ -0,0 +1,214 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from rich import print
+from utils.codec import dumps
+from utils.utils import write_atomic
+import asyncio
+import time
+
+# Seconds; wide enough for both sub-millisecond parses and browser logins
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the largest bucket for the overflow)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def cumulative(self) -> list:
+        """[(le, count)] as Prometheus expects, ending with +Inf."""
+        out = []
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            out.append((bound, seen))
+        out.append(("+Inf", self.count))
+        return out
+
+
+class Metrics:
+    """
+    Counters and histograms of one program, keyed by name and labels. Updates are plain
+    dict operations on the event loop thread, cheap enough for every request.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self.key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self.key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def select(self, series: dict, name: str, labels: dict):
+        """Values of `series` named name whose labels include labels."""
+        wanted = set(self.key(name, labels)[1])
+        return [value for (n, key), value in series.items() if n == name and wanted <= set(key)]
+
+    def counter(self, name: str, **labels) -> float:
+        """Sum of a counter over every label set matching labels."""
+        return sum(self.select(self.counters, name, labels))
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """Histograms of name matching labels, merged."""
+        merged = Histogram()
+        for histogram in self.select(self.histograms, name, labels):
+            merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+            merged.sum += histogram.sum
+            merged.count += histogram.count
+        return merged
+
+    def snapshot(self) -> dict:
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self.counters.items()
+            ],
+            "histograms": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "sum": h.sum,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                    "buckets": h.cumulative(),
+                }
+                for (name, labels), h in self.histograms.items()
+            ],
+        }
+
+    def summary(self, program: str) -> str:
+        requests = self.histogram("request_seconds")
+        statuses = {}
+        for (name, labels), value in self.counters.items():
+            if name == "requests_total":
+                status = dict(labels).get("status")
+                statuses[status] = statuses.get(status, 0) + int(value)
+        stages = sorted({dict(labels).get("stage") for name, labels in self.histograms if name == "parse_seconds"})
+        parse = ", ".join(f"{stage} {self.histogram('parse_seconds', stage=stage).sum:.2f}s" for stage in stages)
+        uploads = self.histogram("upload_seconds")
+        logins = self.histogram("browser_login_seconds")
+        return (
+            f"{program}: {requests.count} requests {statuses}, "
+            f"latency p50 {requests.quantile(0.5)}s p95 {requests.quantile(0.95)}s, "
+            f"{self.counter('bytes_out_total') / 1e6:.1f} MB out / {self.counter('bytes_in_total') / 1e6:.1f} MB in, "
+            f"limiter wait {self.histogram('limiter_wait_seconds').sum:.1f}s, "
+            f"parse {parse or '-'}, "
+            f"{uploads.count} uploads in {uploads.sum:.1f}s, "
+            f"{logins.count} browser logins in {logins.sum:.1f}s, "
+            f"{int(self.counter('results_total'))} results"
+        )
+
+
+def prometheus_text(metrics: dict) -> str:
+    """Prometheus exposition text for {program: Metrics}, every series labelled with its program."""
+
+    def label_text(program, labels, extra=()):
+        pairs = [("program", program), *labels, *extra]
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    # All series of one metric family have to follow its TYPE line, whatever program they belong to
+    families = {}
+    for program, m in metrics.items():
+        for (name, labels), value in m.counters.items():
+            families.setdefault((name, "counter"), []).append(f"crawler_{name}{label_text(program, labels)} {value}")
+        for (name, labels), h in m.histograms.items():
+            lines = families.setdefault((name, "histogram"), [])
+            for bound, count in h.cumulative():
+                lines.append(f"crawler_{name}_bucket{label_text(program, labels, [('le', bound)])} {count}")
+            lines.append(f"crawler_{name}_sum{label_text(program, labels)} {h.sum}")
+            lines.append(f"crawler_{name}_count{label_text(program, labels)} {h.count}")
+
+    out = []
+    for (name, kind), lines in sorted(families.items()):
+        out.append(f"# TYPE crawler_{name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+class MetricsExporter:
+    """
+    Writes every program's metrics to `path` each `interval` seconds while the crawl runs, as
+    Prometheus text (for node_exporter's textfile collector) or a JSON snapshot, and prints a
+    summary line per program when closed.
+    """
+
+    def __init__(self, metrics: dict, path: str = "db/metrics.json", interval: float = 30, format: str = "json"):
+        self.metrics = metrics
+        self.path = Path(path)
+        self.interval = interval
+        self.format = format
+        self.started_at = time.time()
+        self.task = None
+
+    def render(self) -> bytes:
+        if self.format == "prometheus":
+            return prometheus_text(self.metrics).encode()
+        return dumps({
+            "started_at": self.started_at,
+            "written_at": time.time(),
+            "programs": {program: m.snapshot() for program, m in self.metrics.items()},
+        })
+
+    def write(self):
+        write_atomic(self.path, self.render())
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.write()
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        self.write()
+        for program, m in self.metrics.items():
+            print(m.summary(program))
@@ -0,0 +1,103 @@
+from pathlib import Path
+from utils.codec import dumps
+from utils.utils import read_json, write_atomic
+import asyncio
+import time
+
+
+class AdaptiveLimiter:
+    """
+    Token bucket allowing `rate` requests per `time_period` seconds, used like AsyncLimiter (`async with limiter:`).
+    The rate follows AIMD on the feedback it is given: every `window` clean responses add `increase`,
+    a 403/429/5xx, transport error or expired session multiplies it by `decrease` (at most once per
+    `cooldown` seconds, so one burst of failures counts as one signal). Increases pause while latency
+    runs well above the best seen so far.
+    """
+
+    def __init__(self, rate: float = 40, time_period: float = 60, min_rate: float = 5, max_rate: float = 600,
+                 increase: float = 2, decrease: float = 0.5, window: int = 10, cooldown: float = 10):
+        self.time_period = time_period
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+        self.cooldown = cooldown
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.tokens = 1.0
+        self.updated_at = time.monotonic()
+        self.successes = 0
+        self.last_decrease = 0.0
+        self.latency = None
+        self.best_latency = None
+        self.lock = asyncio.Lock()
+        # Optional callable taking the seconds each acquire() waited, for metrics
+        self.observer = None
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate / self.time_period)
+        self.updated_at = now
+
+    async def acquire(self):
+        start = time.monotonic()
+        # Holding the lock while sleeping keeps waiters in FIFO order
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                await asyncio.sleep((1 - self.tokens) * self.time_period / self.rate)
+        if self.observer:
+            self.observer(time.monotonic() - start)
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *args):
+        return None
+
+    def feedback(self, status: int = None, latency: float = None, error: bool = False, expired: bool = False):
+        if error or expired or status in (403, 429) or (status is not None and status >= 500):
+            self.backoff()
+            return
+
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            self.best_latency = self.latency if self.best_latency is None else min(self.best_latency, self.latency)
+            if self.latency > 2 * self.best_latency:
+                return
+
+        self.successes += 1
+        if self.successes >= self.window:
+            self.successes = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def backoff(self):
+        now = time.monotonic()
+        self.successes = 0
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self._refill()
+
+
+class RateStore:
+    """Last settled limiter rate per program, so the next run starts from a known-good rate."""
+
+    def __init__(self, path: str = "db/rates.json"):
+        self.path = Path(path)
+
+    def load(self, program: str, default: float = None) -> float | None:
+        return read_json(self.path, {}).get(program, default)
+
+    def save(self, program: str, rate: float):
+        rates = read_json(self.path, {})
+        rates[program] = rate
+        write_atomic(self.path, dumps(rates))
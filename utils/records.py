@@ -0,0 +1,97 @@
+import sys
+
+# Cabin spellings used by the programs -> IATA cabin code
+CABIN_CODES = {
+    "y": "Y", "eco": "Y", "economy": "Y",
+    "w": "W", "pre": "W", "premium": "W", "premiumeconomy": "W", "premium economy": "W",
+    "j": "J", "c": "J", "bus": "J", "business": "J",
+    "f": "F", "fir": "F", "first": "F",
+}
+
+
+def normalize_cabin(value) -> str:
+    key = str(value or "").strip().lower().replace("_", "")
+    return CABIN_CODES.get(key, key.upper())
+
+
+def normalize_points(value) -> int | None:
+    """
+    Points as an int from 60000, 60000.0, "60,000" or " 60000.0 ". Anything else, such as
+    "60,000 + AUD 120", is None rather than a number pieced together from its digits.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = "".join(str(value).replace(",", "").split())
+    try:
+        return int(float(text))
+    except (ValueError, OverflowError):
+        return None
+
+
+class FlightResult:
+    """
+    One award seat found by a search, shared by every program.
+    Slotted to keep large crawls small; airport, cabin, program and date strings are interned
+    so the many repeats across results share one object each.
+    """
+
+    __slots__ = ("origin", "destination", "date", "cabin", "points", "route", "stops", "program")
+    FIELDS = __slots__
+
+    def __init__(self, origin: str, destination: str, date: str, cabin, points, route: str, stops: int, program: str):
+        self.origin = sys.intern(origin)
+        self.destination = sys.intern(destination)
+        self.date = sys.intern(date)
+        self.cabin = sys.intern(normalize_cabin(cabin))
+        self.points = normalize_points(points)
+        self.route = route
+        self.stops = int(stops)
+        self.program = sys.intern(program)
+
+    def as_tuple(self) -> tuple:
+        return (self.origin, self.destination, self.date, self.cabin, self.points, self.route, self.stops, self.program)
+
+    def to_dict(self) -> dict:
+        return dict(zip(self.FIELDS, self.as_tuple()))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FlightResult":
+        return cls(*(data[f] for f in cls.FIELDS))
+
+    def __eq__(self, other):
+        if not isinstance(other, FlightResult):
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        return f"FlightResult({', '.join(f'{f}={getattr(self, f)!r}' for f in self.FIELDS)})"
+
+
+class Batch(list):
+    """
+    The records one search hands to consumers, with what it takes to store its key: counts maps
+    every date the response answered to its row count, dates lists the answered dates whose
+    snapshot changed (only their records are uploaded, a changed date may have none left), deltas has
+    the ChangeIndex delta of each changed date when there is an index, and uploads holds the
+    futures of every upload the key waits on before it counts as done.
+    """
+
+    __slots__ = ("program", "origin", "destination", "date", "counts", "dates", "deltas", "uploads")
+
+    def __init__(self, records=(), program: str = "", origin: str = "", destination: str = "", date: str = "",
+                 counts: dict = None, dates=(), deltas: dict = None):
+        super().__init__(records)
+        self.program = program
+        self.origin = origin
+        self.destination = destination
+        self.date = date
+        self.counts = counts or {}
+        self.dates = list(dates)
+        self.deltas = deltas or {}
+        self.uploads = []
+
@@ -0,0 +1,81 @@
+from collections.abc import Mapping, Sequence
+
+
+def collect_ids(obj) -> dict:
+    """Map every "@id" in the tree to its object, walking with an explicit stack instead of recursion."""
+    ids = {}
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if isinstance(o, dict):
+            if "@id" in o:
+                ids[o["@id"]] = o
+            stack.extend(v for v in o.values() if isinstance(v, (dict, list)))
+        elif isinstance(o, list):
+            stack.extend(v for v in o if isinstance(v, (dict, list)))
+    return ids
+
+
+def view(value, ids: dict):
+    """Follow "@ref" links and wrap containers so their children are dereferenced only when read."""
+    hops = 0
+    while isinstance(value, dict) and "@ref" in value:
+        value = ids[value["@ref"]]
+        hops += 1
+        if hops > len(ids):
+            raise ValueError(f"Cyclic @ref chain at {value.get('@id')}")
+    if isinstance(value, dict):
+        return RefDict(value, ids)
+    if isinstance(value, list):
+        return RefList(value, ids)
+    return value
+
+
+class RefDict(Mapping):
+    """Read-only view of a dict whose "@ref" values resolve on access; nothing is copied."""
+
+    __slots__ = ("raw", "ids")
+
+    def __init__(self, raw: dict, ids: dict):
+        self.raw = raw
+        self.ids = ids
+
+    def __getitem__(self, key):
+        return view(self.raw[key], self.ids)
+
+    def get(self, key, default=None):
+        if key in self.raw:
+            return view(self.raw[key], self.ids)
+        return default
+
+    def __contains__(self, key):
+        return key in self.raw
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    def __len__(self):
+        return len(self.raw)
+
+
+class RefList(Sequence):
+    """Read-only view of a list whose items resolve "@ref" links on access."""
+
+    __slots__ = ("raw", "ids")
+
+    def __init__(self, raw: list, ids: dict):
+        self.raw = raw
+        self.ids = ids
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [view(v, self.ids) for v in self.raw[index]]
+        return view(self.raw[index], self.ids)
+
+    def __iter__(self):
+        ids = self.ids
+        for v in self.raw:
+            yield view(v, ids)
+
+    def __len__(self):
+        return len(self.raw)
@@ -0,0 +1,121 @@
+from pathlib import Path
+from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, and_, delete, event, insert, select, tuple_
+from sqlalchemy.ext.asyncio import create_async_engine
+from utils.records import FlightResult
+import asyncio
+import time
+
+metadata = MetaData()
+
+# Latest snapshot: the rows from the most recent search of each (program, origin, destination, date)
+results = Table(
+    "results",
+    metadata,
+    Column("program", String, nullable=False),
+    Column("origin", String, nullable=False),
+    Column("destination", String, nullable=False),
+    Column("date", String, nullable=False),
+    Column("cabin", String, nullable=False),
+    Column("points", Integer),
+    Column("route", String, nullable=False),
+    Column("stops", Integer, nullable=False),
+    Column("observed_at", Float, nullable=False),
+    Index("ix_results_route", "origin", "destination", "date", "cabin", "program"),
+    Index("ix_results_points", "points"),
+)
+
+# Every observation ever stored, for history and price-change analysis
+observations = Table(
+    "observations",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("program", String, nullable=False),
+    Column("origin", String, nullable=False),
+    Column("destination", String, nullable=False),
+    Column("date", String, nullable=False),
+    Column("cabin", String, nullable=False),
+    Column("points", Integer),
+    Column("route", String, nullable=False),
+    Column("stops", Integer, nullable=False),
+    Column("observed_at", Float, nullable=False),
+    Index("ix_observations_route", "origin", "destination", "date", "cabin", "program"),
+    Index("ix_observations_points", "points"),
+)
+
+
+class ResultStore:
+    """
+    Local SQLite copy of crawl results (async SQLAlchemy over aiosqlite, WAL mode) so questions like
+    "cheapest business seat MEL->NRT in March across all programs" are an indexed query.
+    write() takes the batches crawl_iter yields: each batch replaces the snapshot rows of every
+    date its response answered, dates now without seats included, and is appended to the
+    observation history.
+    """
+
+    def __init__(self, path: str = "db/results.db"):
+        self.path = Path(path)
+        self.engine = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self.lock:
+            if self.engine is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                engine = create_async_engine(f"sqlite+aiosqlite:///{self.path}")
+
+                @event.listens_for(engine.sync_engine, "connect")
+                def set_pragmas(dbapi_connection, connection_record):
+                    cursor = dbapi_connection.cursor()
+                    cursor.execute("PRAGMA journal_mode=WAL")
+                    cursor.execute("PRAGMA synchronous=NORMAL")
+                    cursor.close()
+
+                async with engine.begin() as conn:
+                    await conn.run_sync(metadata.create_all)
+                self.engine = engine
+        return self.engine
+
+    async def close(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+    async def write(self, batch):
+        if not batch.counts:
+            return
+        engine = await self.connect()
+        now = time.time()
+        rows = [dict(r.to_dict(), observed_at=now) for r in batch]
+        keys = {(batch.program, batch.origin, batch.destination, d) for d in batch.counts}
+        async with engine.begin() as conn:
+            await conn.execute(
+                delete(results).where(
+                    tuple_(results.c.program, results.c.origin, results.c.destination, results.c.date).in_(keys)
+                )
+            )
+            if rows:
+                await conn.execute(insert(results), rows)
+                await conn.execute(insert(observations), rows)
+
+    async def cheapest(self, origin: str, destination: str, cabin: str = None, date_from: str = None,
+                       date_to: str = None, program: str = None, limit: int = 10) -> list:
+        """Cheapest current seats on a route, optionally narrowed by cabin code, date range (inclusive) and program."""
+        engine = await self.connect()
+        conditions = [results.c.origin == origin, results.c.destination == destination, results.c.points.is_not(None)]
+        if cabin:
+            conditions.append(results.c.cabin == cabin)
+        if date_from:
+            conditions.append(results.c.date >= date_from)
+        if date_to:
+            conditions.append(results.c.date <= date_to)
+        if program:
+            conditions.append(results.c.program == program)
+        query = (
+            select(*(results.c[f] for f in FlightResult.FIELDS))
+            .where(and_(*conditions))
+            .order_by(results.c.points, results.c.date)
+            .limit(limit)
+        )
+        async with engine.connect() as conn:
+            rows = (await conn.execute(query)).all()
+        return [FlightResult(*row) for row in rows]
@@ -0,0 +1,66 @@
+from datetime import date as Date
+import math
+import random
+import time
+
+
+class PriorityScheduler:
+    """
+    Orders a program's (date, origin, destination) keys by how much a request for them is worth
+    and keeps the best `budget` of them for the run.
+
+    priority = staleness * (proximity_weight * proximity + change_weight * volatility + base)
+
+    - proximity: exp(-days_out / horizon_days), next week's dates before next year's
+    - volatility: 1 - 1 / version from the ChangeIndex, i.e. how often the key's availability
+      has changed so far (keys never answered get unknown_volatility)
+    - staleness: 1 - exp(-age / staleness_scale) since the AvailabilityIndex last answered the key,
+      1 for keys never answered; a key fetched moments ago is worth almost nothing
+
+    With sample=True the budget is filled by weighted sampling without replacement instead of a
+    strict top-N cut, so low-priority keys still come up now and then.
+    """
+
+    def __init__(self, availability_index=None, change_index=None, budget: int = None, horizon_days: float = 60,
+                 staleness_scale: float = 24 * 3600, proximity_weight: float = 1.0, change_weight: float = 1.0,
+                 base: float = 0.1, unknown_volatility: float = 0.5, sample: bool = True):
+        self.availability_index = availability_index
+        self.change_index = change_index
+        self.budget = budget
+        self.horizon_days = horizon_days
+        self.staleness_scale = staleness_scale
+        self.proximity_weight = proximity_weight
+        self.change_weight = change_weight
+        self.base = base
+        self.unknown_volatility = unknown_volatility
+        self.sample = sample
+
+    async def rank(self, program: str, keys) -> list:
+        """[(key, priority)] for the keys worth fetching this run, highest priority first."""
+        checked = await self.availability_index.checked(program) if self.availability_index else {}
+        versions = await self.change_index.versions(program) if self.change_index else {}
+        now = time.time()
+        today = Date.today()
+
+        ranked = []
+        for key in keys:
+            d, origin, destination = key
+            days_out = max((Date.fromisoformat(d) - today).days, 0)
+            proximity = math.exp(-days_out / self.horizon_days)
+            version = versions.get((origin, destination, d))
+            volatility = 1 - 1 / version if version else self.unknown_volatility
+            checked_at = checked.get((origin, destination, d))
+            staleness = 1 - math.exp(-(now - checked_at) / self.staleness_scale) if checked_at else 1.0
+            priority = staleness * (self.proximity_weight * proximity + self.change_weight * volatility + self.base)
+            ranked.append((key, priority))
+
+        if self.budget is not None and len(ranked) > self.budget:
+            if self.sample:
+                # Efraimidis-Spirakis: the `budget` largest u ** (1 / weight) are a weighted sample
+                weight = {key: random.random() ** (1 / max(priority, 1e-9)) for key, priority in ranked}
+                ranked.sort(key=lambda item: weight[item[0]], reverse=True)
+            else:
+                ranked.sort(key=lambda item: item[1], reverse=True)
+            ranked = ranked[:self.budget]
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked
@@ -0,0 +1,95 @@
+from contextlib import asynccontextmanager
+from rich import print
+import asyncio
+
+
+class PoolMember:
+    __slots__ = ("identity", "in_flight", "failures", "healthy")
+
+    def __init__(self, identity):
+        self.identity = identity
+        self.in_flight = 0
+        self.failures = 0
+        self.healthy = True
+
+
+class SessionPool:
+    """
+    Several identities of one program (extractor instances, each with its own proxy, cookies,
+    captured headers, limiter and refresh state) behind least-loaded dispatch.
+
+    A member whose searches raise max_failures times in a row is ejected: it gets no new searches while
+    it re-authenticates on its own, and rejoins once its session validates again. The other
+    members keep crawling meanwhile.
+    """
+
+    def __init__(self, identities, max_failures: int = 3, retry_interval: float = 60):
+        self.members = [PoolMember(identity) for identity in identities]
+        self.by_identity = {id(m.identity): m for m in self.members}
+        self.max_failures = max_failures
+        self.retry_interval = retry_interval
+        self.available = asyncio.Event()
+        self.available.set()
+        self.recovering = set()
+
+    @property
+    def identities(self) -> list:
+        return [m.identity for m in self.members]
+
+    def pick(self):
+        healthy = [m for m in self.members if m.healthy]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda m: m.in_flight)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Identity of the least-loaded healthy member; parks while every member is re-authenticating."""
+        while (member := self.pick()) is None:
+            self.available.clear()
+            await self.available.wait()
+        member.in_flight += 1
+        try:
+            yield member.identity
+        except Exception:
+            self.report(member.identity, False)
+            raise
+        finally:
+            member.in_flight -= 1
+
+    def report(self, identity, ok: bool):
+        """Outcome of a search run with identity (ok unless it raised); enough failures in a row eject it."""
+        member = self.by_identity[id(identity)]
+        if ok:
+            member.failures = 0
+            return
+        member.failures += 1
+        if member.healthy and member.failures >= self.max_failures:
+            self.eject(member)
+
+    def eject(self, member):
+        member.healthy = False
+        print(f"{member.identity.session_key}: ejected after {member.failures} failed searches, re-authenticating")
+        task = asyncio.create_task(self.reauthenticate(member))
+        self.recovering.add(task)
+        task.add_done_callback(self.recovering.discard)
+
+    async def reauthenticate(self, member):
+        identity = member.identity
+        while True:
+            try:
+                await identity.refresh_session()
+                if await identity.validate_session():
+                    break
+            except Exception as e:
+                print(f"{identity.session_key}: re-authentication failed: {e}")
+            await asyncio.sleep(self.retry_interval)
+        member.failures = 0
+        member.healthy = True
+        self.available.set()
+        print(f"{identity.session_key}: back in the pool")
+
+    async def close(self):
+        for task in list(self.recovering):
+            task.cancel()
+        await asyncio.gather(*self.recovering, return_exceptions=True)
@@ -0,0 +1,26 @@
+from pathlib import Path
+from utils.codec import dumps
+from utils.utils import read_json, write_atomic
+import time
+
+
+class SessionStore:
+    """
+    On-disk store of captured login state (headers, cookies and program specific values) per program.
+    Entries older than ttl seconds are treated as missing so a stale session never skips the browser.
+    """
+
+    def __init__(self, path: str = "db/sessions.json", ttl: float = 6 * 3600):
+        self.path = Path(path)
+        self.ttl = ttl
+
+    def load(self, program: str) -> dict | None:
+        entry = read_json(self.path, {}).get(program)
+        if not entry or time.time() - entry.get("saved_at", 0) > self.ttl:
+            return None
+        return entry["state"]
+
+    def save(self, program: str, state: dict):
+        sessions = read_json(self.path, {})
+        sessions[program] = {"saved_at": time.time(), "state": state}
+        write_atomic(self.path, dumps(sessions))
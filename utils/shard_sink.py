@@ -0,0 +1,150 @@
+from utils.codec import dumps, loads
+from utils.records import FlightResult
+import asyncio
+import gzip
+import time
+
+
+def encode_shard(records) -> tuple:
+    """
+    Gzip NDJSON shard where every (origin, destination, month) is its own gzip member, so a
+    reader can range-read one route and month with the offset/length listed in the manifest.
+    The concatenated members are still one valid .gz file for whole-shard readers.
+    """
+    records = sorted(records, key=lambda r: (r.origin, r.destination, r.date))
+    members = []
+    chunks = []
+    offset = 0
+    start = 0
+    for i in range(1, len(records) + 1):
+        first = records[start]
+        if i < len(records):
+            r = records[i]
+            if (r.origin, r.destination, r.date[:7]) == (first.origin, first.destination, first.date[:7]):
+                continue
+        group = records[start:i]
+        chunk = gzip.compress(b"".join(dumps(r) + b"\n" for r in group), compresslevel=6)
+        members.append({
+            "origin": first.origin,
+            "destination": first.destination,
+            "month": first.date[:7],
+            "date_min": group[0].date,
+            "date_max": group[-1].date,
+            "rows": len(group),
+            "offset": offset,
+            "length": len(chunk),
+        })
+        chunks.append(chunk)
+        offset += len(chunk)
+        start = i
+    return b"".join(chunks), members
+
+
+def encode_deltas(deltas) -> bytes:
+    """Gzip NDJSON of delta lines: the key, its new and previous version, the rows added and removed."""
+    return gzip.compress(b"".join(dumps(d) + b"\n" for d in deltas), compresslevel=6)
+
+
+def decode_member(data: bytes) -> list:
+    """Records from a range-read member (or a whole shard)."""
+    return [FlightResult.from_dict(loads(line)) for line in gzip.decompress(data).splitlines() if line]
+
+
+class ShardSink:
+    """
+    Buffers one program's results for a run and writes them as a few compressed shards
+    ({program}/runs/{run_id}/part-NNNNN.ndjson.gz) plus a manifest.json, instead of one tiny
+    object per route and date. Uploads go through the program's ResultUploader, so any bucket
+    it wraps works, including LocalBucket.
+
+    Shards hold the full current rows of every snapshot that changed; the changes themselves
+    (including rows that disappeared, and dates left with no seats at all) go to delta files
+    ({program}/runs/{run_id}/deltas-NNNNN.ndjson.gz) written alongside them.
+
+    The manifest lists the shards stored so far and is rewritten after each one, so a crashed run
+    still points at everything it stored. write() returns a future that resolves to True once the
+    shard holding the batch and the manifest listing it are stored (False if either upload failed),
+    which is when the batch's keys may count as done.
+    """
+
+    def __init__(self, uploader, program: str, run_id: str, shard_rows: int = 50000):
+        self.uploader = uploader
+        self.program = program
+        self.run_id = run_id
+        self.shard_rows = shard_rows
+        self.prefix = f"{program}/runs/{run_id}"
+        self.buffer = []
+        self.delta_buffer = []
+        # Outcome of the shard being buffered, shared by every batch written into it
+        self.stored = None
+        self.shards = []
+        self.deltas = []
+
+    async def write(self, batch) -> asyncio.Future:
+        if self.stored is None:
+            self.stored = asyncio.get_running_loop().create_future()
+        stored = self.stored
+        # Unchanged snapshots were stored when they last changed, only changed dates get rows here
+        changed = set(batch.dates)
+        self.buffer.extend(r for r in batch if r.date in changed)
+        for date, delta in batch.deltas.items():
+            # A first version is all in the shard already
+            if delta["previous_version"] is not None:
+                self.delta_buffer.append({
+                    "program": self.program,
+                    "origin": batch.origin,
+                    "destination": batch.destination,
+                    "date": date,
+                    **delta,
+                })
+        if len(self.buffer) + len(self.delta_buffer) >= self.shard_rows:
+            await self.flush_shard()
+        return stored
+
+    async def flush_shard(self):
+        """Store the buffered rows and deltas and the manifest listing them, then resolve their batches."""
+        if self.stored is None:
+            return
+        records, self.buffer = self.buffer, []
+        deltas, self.delta_buffer = self.delta_buffer, []
+        stored, self.stored = self.stored, None
+        shard = delta_part = None
+        uploads = []
+        # Sorting and compressing a large shard is CPU work, keep it off the event loop
+        if records:
+            data, members = await asyncio.to_thread(encode_shard, records)
+            name = f"{self.prefix}/part-{len(self.shards):05d}.ndjson.gz"
+            uploads.append(await self.uploader.put(name, data, content_type="application/gzip"))
+            shard = {"name": name, "rows": len(records), "bytes": len(data), "members": members}
+        if deltas:
+            data = await asyncio.to_thread(encode_deltas, deltas)
+            name = f"{self.prefix}/deltas-{len(self.deltas):05d}.ndjson.gz"
+            uploads.append(await self.uploader.put(name, data, content_type="application/gzip"))
+            delta_part = {"name": name, "rows": len(deltas), "bytes": len(data)}
+        ok = all(await asyncio.gather(*uploads))
+        if ok and uploads:
+            if shard:
+                self.shards.append(shard)
+            if delta_part:
+                self.deltas.append(delta_part)
+            ok = await self.write_manifest()
+        stored.set_result(ok)
+
+    async def write_manifest(self, complete: bool = False) -> bool:
+        manifest = {
+            "program": self.program,
+            "run_id": self.run_id,
+            "created_at": time.time(),
+            "complete": complete,
+            "format": "ndjson.gz",
+            "columns": list(FlightResult.FIELDS),
+            "rows": sum(s["rows"] for s in self.shards),
+            "shards": self.shards,
+            "deltas": self.deltas,
+        }
+        return await (await self.uploader.put(f"{self.prefix}/manifest.json", dumps(manifest)))
+
+    async def close(self):
+        """Write the remaining rows, then the final manifest."""
+        await self.flush_shard()
+        await self.write_manifest(complete=True)
@@ -0,0 +1,178 @@
+from contextlib import asynccontextmanager
+from pathlib import Path
+import aiosqlite
+import asyncio
+import itertools
+import time
+
+
+class TaskQueue:
+    """
+    Shared queue of (program, origin, destination, date) search keys for one crawl run, so any
+    number of worker processes or containers can split the matrix between them. SQLite (WAL mode)
+    is the backend: every process pointed at the same file and run takes part.
+
+    lease() hands a key to exactly one owner until its lease expires; live owners keep their leases
+    with heartbeat(), and keys whose owner died go back to the pool once the lease runs out; keys
+    an owner could not store it release()s right away. A key is tried at most max_attempts times.
+    """
+
+    def __init__(self, path: str = "db/tasks.db", run: str = "default", lease_ttl: float = 120, max_attempts: int = 3):
+        self.path = Path(path)
+        self.run = run
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max_attempts
+        self.db = None
+        self.lock = asyncio.Lock()
+        self.busy = asyncio.Lock()
+
+    async def connect(self):
+        async with self.lock:
+            if self.db is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # Other processes hold the write lock briefly while leasing, wait for it rather than fail
+                self.db = await aiosqlite.connect(self.path, timeout=30)
+                await self.db.execute("PRAGMA journal_mode=WAL")
+                await self.db.execute("""
+                    CREATE TABLE IF NOT EXISTS tasks (
+                        run TEXT NOT NULL,
+                        program TEXT NOT NULL,
+                        origin TEXT NOT NULL,
+                        destination TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        priority REAL NOT NULL DEFAULT 0,
+                        state TEXT NOT NULL DEFAULT 'pending',
+                        owner TEXT,
+                        lease_expires REAL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (run, program, origin, destination, date)
+                    )
+                """)
+                await self.db.execute("CREATE INDEX IF NOT EXISTS ix_tasks_priority ON tasks (run, program, state, priority)")
+                await self.db.commit()
+        return self.db
+
+    @asynccontextmanager
+    async def connection(self):
+        """The connection, for one operation at a time: a cursor another task still has open makes commits fail."""
+        db = await self.connect()
+        async with self.busy:
+            yield db
+
+    async def close(self):
+        if self.db is not None:
+            await self.db.close()
+            self.db = None
+
+    async def enqueue(self, program: str, keys, priorities: dict = None, limit: int = None) -> int:
+        """
+        Add (date, origin, destination) keys, optionally with {key: priority} (leased highest first);
+        keys already in the run are left as they are, so every node may enqueue. With a limit, keys
+        past it are dropped: the run never holds more than limit keys of program, however many
+        nodes enqueue their own picks.
+        """
+        async with self.connection() as db:
+            priorities = priorities or {}
+            before = db.total_changes
+            if limit is not None:
+                # Take the write lock before counting, so two nodes can't both fill the same room
+                await db.execute("BEGIN IMMEDIATE")
+                async with db.execute(
+                    "SELECT COUNT(*) FROM tasks WHERE run = ? AND program = ?", (self.run, program)
+                ) as cursor:
+                    (count,) = await cursor.fetchone()
+                keys = itertools.islice(keys, max(limit - count, 0))
+            await db.executemany(
+                "INSERT OR IGNORE INTO tasks (run, program, origin, destination, date, priority) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (self.run, program, origin, destination, date, priorities.get((date, origin, destination), 0))
+                    for date, origin, destination in keys
+                ),
+            )
+            await db.commit()
+            return db.total_changes - before
+
+    async def lease(self, program: str, owner: str):
+        """The next (date, origin, destination) key for owner, or None when nothing is available right now."""
+        async with self.connection() as db:
+            now = time.time()
+            # A single UPDATE ... RETURNING, so two processes can never lease the same key
+            async with db.execute(
+                """
+                UPDATE tasks SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE rowid = (
+                    SELECT rowid FROM tasks
+                    WHERE run = ? AND program = ? AND attempts < ?
+                        AND (state = 'pending' OR (state = 'leased' AND lease_expires < ?))
+                    ORDER BY priority DESC, date, origin, destination
+                    LIMIT 1
+                )
+                RETURNING date, origin, destination
+                """,
+                (owner, now + self.lease_ttl, self.run, program, self.max_attempts, now),
+            ) as cursor:
+                row = await cursor.fetchone()
+            await db.commit()
+            return tuple(row) if row else None
+
+    async def heartbeat(self, owner: str):
+        """Extend every lease owner holds."""
+        async with self.connection() as db:
+            await db.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE run = ? AND owner = ? AND state = 'leased'",
+                (time.time() + self.lease_ttl, self.run, owner),
+            )
+            await db.commit()
+
+    async def complete(self, program: str, date: str, origin: str, destination: str):
+        async with self.connection() as db:
+            await db.execute(
+                """
+                UPDATE tasks SET state = 'done', owner = NULL, lease_expires = NULL
+                WHERE run = ? AND program = ? AND origin = ? AND destination = ? AND date = ?
+                """,
+                (self.run, program, origin, destination, date),
+            )
+            await db.commit()
+
+    async def release(self, program: str, owner: str, date: str, origin: str, destination: str):
+        """Hand back a key owner could not store, for another attempt (none once it had max_attempts)."""
+        async with self.connection() as db:
+            await db.execute(
+                """
+                UPDATE tasks SET state = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END,
+                    owner = NULL, lease_expires = NULL
+                WHERE run = ? AND program = ? AND origin = ? AND destination = ? AND date = ?
+                    AND state = 'leased' AND owner = ?
+                """,
+                (self.max_attempts, self.run, program, origin, destination, date, owner),
+            )
+            await db.commit()
+
+    async def has_open(self, program: str, owner: str = None) -> bool:
+        """
+        Whether keys are still pending or being worked on, i.e. whether an idle worker should keep
+        polling. Live leases of owner don't count: its own workers finish those themselves.
+        """
+        async with self.connection() as db:
+            now = time.time()
+            async with db.execute(
+                """
+                SELECT 1 FROM tasks
+                WHERE run = ? AND program = ?
+                    AND (state = 'pending' OR (state = 'leased' AND (
+                        (lease_expires >= ? AND owner IS NOT ?) OR (lease_expires < ? AND attempts < ?)
+                    )))
+                LIMIT 1
+                """,
+                (self.run, program, now, owner, now, self.max_attempts),
+            ) as cursor:
+                return await cursor.fetchone() is not None
+
+    async def counts(self, program: str) -> dict:
+        async with self.connection() as db:
+            async with db.execute(
+                "SELECT state, COUNT(*) FROM tasks WHERE run = ? AND program = ? GROUP BY state",
+                (self.run, program),
+            ) as cursor:
+                return dict(await cursor.fetchall())
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from rich import print
+import asyncio
+import time
+
+
+class LocalBlob:
+    def __init__(self, path: Path):
+        self.path = path
+
+    def upload_from_string(self, data, content_type=None):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        mode = "wb" if isinstance(data, bytes) else "w"
+        with open(self.path, mode) as f:
+            f.write(data)
+
+
+class LocalBucket:
+    """Local-directory stand-in for a GCS bucket, exposing the same blob().upload_from_string() surface."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.name = str(self.root)
+
+    def blob(self, name: str) -> LocalBlob:
+        return LocalBlob(self.root / name)
+
+
+class ResultUploader:
+    """
+    Background uploader: callers enqueue (blob_name, payload) and return immediately with a future
+    of the outcome, drainer tasks hand the blocking upload_from_string calls to a thread pool.
+    The queue is bounded so a slow bucket pushes back on the crawl instead of growing memory.
+    """
+
+    def __init__(self, bucket, threads: int = 8, max_queue: int = 500, max_retries: int = 3, retry_backoff: float = 1.0, metrics=None):
+        self.bucket = bucket
+        self.metrics = metrics
+        self.threads = threads
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="uploader")
+        self.drainers = []
+
+    def start(self):
+        if not self.drainers:
+            self.drainers = [asyncio.create_task(self._drain()) for _ in range(self.threads)]
+
+    async def put(self, blob_name: str, payload, content_type: str = "application/json") -> asyncio.Future:
+        """Queue an upload; the future resolves to True once it is stored, False once it was given up on."""
+        self.start()
+        stored = asyncio.get_running_loop().create_future()
+        await self.queue.put((blob_name, payload, content_type, stored))
+        return stored
+
+    async def _drain(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                if item is None:
+                    return
+                await self._upload(*item)
+            finally:
+                self.queue.task_done()
+
+    async def _upload(self, blob_name: str, payload, content_type: str, stored: asyncio.Future):
+        loop = asyncio.get_running_loop()
+        for attempt in range(1, self.max_retries + 1):
+            start = time.monotonic()
+            try:
+                blob = self.bucket.blob(blob_name)
+                await loop.run_in_executor(self.executor, lambda: blob.upload_from_string(payload, content_type=content_type))
+                if self.metrics:
+                    self.metrics.observe("upload_seconds", time.monotonic() - start)
+                    self.metrics.inc("uploads_total", outcome="ok")
+                    self.metrics.inc("upload_bytes_total", len(payload))
+                stored.set_result(True)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"[red]Upload failed for {blob_name} after {attempt} attempts: {e}")
+                    if self.metrics:
+                        self.metrics.inc("uploads_total", outcome="failed")
+                    stored.set_result(False)
+                    return
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+    async def flush(self):
+        """Wait until everything queued so far has been uploaded (or given up on)."""
+        await self.queue.join()
+
+    async def close(self):
+        """Flush pending uploads, then stop the drainers and the thread pool."""
+        if self.drainers:
+            await self.flush()
+            for _ in self.drainers:
+                await self.queue.put(None)
+            await asyncio.gather(*self.drainers)
+            self.drainers = []
+        self.executor.shutdown(wait=True)
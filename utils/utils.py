@@ -1,5 +1,7 @@
 from datetime import datetime, timedelta
+from pathlib import Path
 import json
+from utils.codec import loads, DecodeError
 
 def date_range(days=360, start=0, end=None):
     from datetime import date, timedelta
@@ -26,6 +28,28 @@ def date_add(days=0, date_str=None):
     new_date += timedelta(days=days)
     return new_date.strftime("%Y%m%d")
 
+def parse_date(value):
+    """
+    Best-effort conversion of the date shapes airline APIs return to 'YYYY-MM-DD':
+    epoch milliseconds, ISO strings, 'YYYYMMDD[HHMM]' and 'Mar 12, 2026 9:30:00 AM'.
+    Returns None when the value is not recognised.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000).strftime("%Y-%m-%d")
+    value = str(value).strip()
+    if value[:8].isdigit():
+        return f"{value[0:4]}-{value[4:6]}-{value[6:8]}"
+    if value[:4].isdigit() and value[4:5] == "-":
+        return value[:10]
+    for fmt in ("%b %d, %Y %I:%M:%S %p", "%b %d, %Y"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return None
+
 def deep_json_load(obj):
     """
     Recursively convert JSON strings to dicts/lists wherever possible.
@@ -42,4 +66,55 @@ def deep_json_load(obj):
     elif isinstance(obj, list):
         return [deep_json_load(item) for item in obj]
     else:
-        return obj  # primitive type
\ No newline at end of file
+        return obj  # primitive type
+
+def load_embedded_json(obj, fields):
+    """
+    Decode only the named fields of a response dict that carry JSON encoded as a string
+    (e.g. Cathay's pageBom / requestParams), instead of trying to parse every string
+    like deep_json_load. Values whose first character cannot start an object or array are
+    left alone without attempting a parse. Decoded dicts are checked for the same fields.
+    """
+    if not isinstance(obj, dict):
+        return obj
+    decoded = None
+    for field in fields:
+        value = obj.get(field)
+        if isinstance(value, str):
+            # Fast path: skip anything that is not an embedded object/array
+            stripped = value.lstrip()
+            if stripped[:1] not in ("{", "["):
+                continue
+            try:
+                value = loads(stripped)
+            except DecodeError:
+                continue
+            value = load_embedded_json(value, fields)
+        elif isinstance(value, dict):
+            nested = load_embedded_json(value, fields)
+            if nested is value:
+                continue
+            value = nested
+        else:
+            continue
+        if decoded is None:
+            decoded = dict(obj)
+        decoded[field] = value
+    return obj if decoded is None else decoded
+
+def read_json(path, default=None):
+    """Decoded contents of the JSON file at path, or default when it is missing or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            return loads(f.read())
+    except (OSError, *DecodeError):
+        return default
+
+def write_atomic(path, data: bytes):
+    """Write data to path through a temporary file, so a crash never leaves a half-written file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    tmp.replace(path)
@@ -1,20 +1,20 @@
 from extractor import Extractor
+from utils.refs import collect_ids, view
+from utils.codec import dumps, loads
+from utils.records import FlightResult
+from utils.utils import parse_date
 from typing import List
 from rich import print
 import httpx
-import asyncio
 
 
 class VirginExtractor(Extractor):
-    def __init__(self, proxy: str = None):
-        super().__init__(proxy)
+    def __init__(self, proxy: str = None, **kwargs):
+        super().__init__(proxy, **kwargs)
         self.program = "VA"
         self.base_url = "https://book.virginaustralia.com"
         self.graphql_url = f"{self.base_url}/api/graphql"
         self.login_url = "https://book.virginaustralia.com/dx/VADX/1"
-        self.refresh_lock = asyncio.Lock()
-        self.refresh_condition = asyncio.Condition()
-        self.is_refreshing = False
     
     async def headers_from_browser(self, url, headless = "virtual") -> dict:
         await super().headers_from_browser(url, headless)
@@ -25,17 +25,21 @@ class VirginExtractor(Extractor):
         })
         return self.session.headers, self.session.cookies
 
+    async def refresh(self):
+        await self.headers_from_browser(self.login_url, "virtual")
+        await self.preflight_check()
+
     async def preflight_check(self):
+        while not await self.validate_session():
+            print('invalid cookie, re login')
+            await self.headers_from_browser(self.login_url, "virtual")
+
+    async def validate_session(self) -> bool:
         from datetime import date, timedelta
         today = date.today()
         dt =  (today + timedelta(days=2)).isoformat()
-        while True:
-            resp = await self._fetch_flights_once("MEL", "SYD", dt)
-            if not resp or resp.status_code >= 400:
-                print('invalid cookie, re login')
-                await self.headers_from_browser(self.login_url, "virtual")
-            else:
-                break
+        resp = await self._fetch_flights_once("MEL", "SYD", dt)
+        return bool(resp) and resp.status_code < 400
 
     async def search_flights_for_date(
         self, origin: str, destination: str, date: str
@@ -73,62 +77,70 @@ class VirginExtractor(Extractor):
                 'query': 'query bookingAirSearch($airSearchInput: CustomAirSearchInput) {\n                bookingAirSearch(airSearchInput: $airSearchInput) {\n                    originalResponse\n                    __typename\n                }\n            }',
             }
 
+            generation = await self.wait_for_session()
             try:
-                response = await self.session.post(
+                response = await self.post(
                     self.graphql_url,
-                    json=json_data,
+                    data=dumps(json_data),
                 )
                 if response.status_code > 400:
-                    await self.headers_from_browser(self.login_url, "virtual")
-                    await self.preflight_check()
-                    response = await self.session.post(
+                    await self.refresh_session(generation)
+                    await self.wait_for_session()
+                    response = await self.post(
                         self.graphql_url,
-                        json=json_data,
+                        data=dumps(json_data),
                         # timeout=10
                     )
-                data = response.json()
+                # Still failing after the refresh: an error body is no answer for this date
+                response.raise_for_status()
+                with self.metrics.timer("parse_seconds", stage="decode"):
+                    data = loads(response.content)
                 origin_offers = data.get('data', {}).get('bookingAirSearch', {}).get('originalResponse', {}).get('unbundledOffers', [])
-                resolved = self.resolve_refs(origin_offers)
-                results = self.extract_offers(resolved, origin, destination, date)
+                with self.metrics.timer("parse_seconds", stage="resolve_refs"):
+                    resolved = self.resolve_refs(origin_offers)
+                with self.metrics.timer("parse_seconds", stage="extract_offers"):
+                    results = self.extract_offers(resolved, origin, destination, date)
+
+                # The response also answers its neighbouring departure dates. Dates an earlier
+                # response of this run already answered are dropped, the rest are recorded and
+                # marked covered so the crawl does not query them again.
+                extra = self.response_dates(resolved) - {date}
+                seen = {d for d in extra if (origin, destination, d) in self.covered_keys}
+                extra -= seen
+                if seen:
+                    results = [r for r in results if r.date not in seen]
+                self.mark_covered(origin, destination, extra)
+                self.mark_answered(origin, destination, [date, *sorted(extra)])
 
                 return results
             
             except httpx.ReadTimeout as e:
                 print(f"Timeout VA fetching for {origin} → {destination} on {date}: {e}")
-                await self.headers_from_browser(self.login_url, "virtual")
-                await self.preflight_check()
-                return []
+                await self.refresh_session(generation)
+                raise
             except Exception as e:
                 print(f"Error VA fetching for {origin} → {destination} on {date}:{type(e)}: {e}")
-                await self.headers_from_browser(self.login_url, "virtual")
-                await self.preflight_check()
-                return []
+                await self.refresh_session(generation)
+                raise
 
     def resolve_refs(self, obj):
-        id_map = {}
-
-        def collect(o):
-            if isinstance(o, dict):
-                if "@id" in o:
-                    id_map[o["@id"]] = o
-                for v in o.values():
-                    collect(v)
-            elif isinstance(o, list):
-                for v in o:
-                    collect(v)
-
-        def deref(o):
-            if isinstance(o, dict):
-                if "@ref" in o:
-                    return deref(id_map[o["@ref"]])
-                return {k: deref(v) for k, v in o.items()}
-            elif isinstance(o, list):
-                return [deref(v) for v in o]
-            else:
-                return o
-
-        collect(obj)
-        return deref(obj)
+        """
+        Lazy view of obj where "@ref" nodes read as the object carrying the matching "@id".
+        Only the paths extract_offers walks get dereferenced, shared sub-objects are never
+        copied and neither pass recurses, so deep payloads cannot hit the recursion limit.
+        """
+        return view(obj, collect_ids(obj))
+
+    def response_dates(self, offers) -> set:
+        """Every departure date the offers of a bookingAirSearch response are for."""
+        dates = set()
+        for date_offers in offers:
+            for offer in date_offers:
+                if offer:
+                    day = parse_date((offer.get("departureDates") or [None])[0])
+                    if day:
+                        dates.add(day)
+        return dates
 
     def extract_offers(self, offers, origin, destination, date):
         results = []
@@ -141,7 +153,7 @@ class VirginExtractor(Extractor):
                 if not offer.get("offerInformation", {}).get("negotiated", False):
                     continue
 
-                cabin = offer.get("cabinClass")[:3]
+                cabin = offer.get("cabinClass")
                 fare_alt = (
                     offer.get("fare", {})
                         .get("alternatives", [[[]]])[0][0]
@@ -188,23 +200,19 @@ class VirginExtractor(Extractor):
                     continue
 
                 if fare_alt:
-                    results.append({
-                        "origin": origin,
-                        "destination": destination,
-                        "date": (offer.get("departureDates") or [date])[0],
-                        "cabin": cabin,
-                        "points": fare_alt.get("amount"),
-                        "route": segs_str,
-                        "stops": stops,
-                        "program": self.program 
-                    })
+                    results.append(FlightResult(
+                        origin=origin,
+                        destination=destination,
+                        date=parse_date((offer.get("departureDates") or [None])[0]) or date,
+                        cabin=cabin,
+                        points=fare_alt.get("amount"),
+                        route=segs_str,
+                        stops=stops,
+                        program=self.program,
+                    ))
 
         return results
 
-    async def log_request(self, request):        
-        pass
-    async def log_response(self, response):
-        pass
     async def _fetch_flights_once(self, origin: str, destination: str, date: str) -> httpx.Response:
         """Make one raw GraphQL request — no retries, no recursion."""
         try:
@@ -228,7 +236,7 @@ class VirginExtractor(Extractor):
                 'query': 'query bookingAirSearch($airSearchInput: CustomAirSearchInput) {\nbookingAirSearch(airSearchInput: $airSearchInput) {\noriginalResponse\n__typename\n}\n}',
             }
 
-            return await self.session.post(self.graphql_url, json=json_data)
+            return await self.post(self.graphql_url, data=dumps(json_data))
         except Exception as e:
             print(f"Error VA fetching for {origin} → {destination} on {date}:{type(e)}: {e}")
             return None